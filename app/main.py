@@ -22,8 +22,10 @@ if sys.version_info < (3, 8):
     raise RuntimeError("System requires Python 3.8+.")
 
 # Internal Modules
-from pipeline.data_processor import DataIngestor, DataCleaner, MetricsEngine, generate_mock_data
-from pipeline.ai_enricher import ReviewAnalyzer
+from pipeline.data_processor import DataIngestor, DataCleaner, MetricsEngine, IdDictionary, generate_mock_data
+from pipeline.ai_enricher import ReviewAnalyzer, PACK_SIZE, ROUTER_THRESHOLD, DEDUP_MAX_DISTANCE
+from pipeline.cache import ArtifactCache, stream_digest
+from pipeline.jobs import JobManager, RUNNING, QUEUED, DONE, CANCELLED, FAILED
 
 # --- MACROS / CONSTANTS ----------------------------------------------------------------
 PAGE_TITLE = "ZIGGWAY"
@@ -32,6 +34,9 @@ LAYOUT_MODE = "wide"
 
 COLOR_SIDEBAR_BG = "#0A0A0A"         
 
+# Processed uploads are shared by every session/restart (keyed by content hash)
+UPLOAD_CACHE = ArtifactCache(max_bytes=2 * 1024 ** 3)
+
 CSS_BUFFER = """
 <style>
     /* Main Styles */
@@ -983,6 +988,10 @@ class ProcessingResult(NamedTuple):
     ltv_df: Optional[pd.DataFrame]
     churn_df: Optional[pd.DataFrame]
     status_code: int  # 0 = OK, 1 = ERROR
+    payments_df: Optional[pd.DataFrame] = None  # Per-payment grain (normalized)
+    reviews_df: Optional[pd.DataFrame] = None  # Per-review grain, with order status/purchase date
+    ids: Optional[IdDictionary] = None  # Surrogate key -> hex ID lookup (display only)
+    rollup: Optional[Dict[str, pd.DataFrame]] = None  # Time rollup cube (all/day/week/month)
 
 class PageContext(NamedTuple):
     """Context passed to render functions to avoid global state."""
@@ -990,6 +999,9 @@ class PageContext(NamedTuple):
     churn: pd.DataFrame
     ltv: pd.DataFrame
     analyzer: ReviewAnalyzer
+    ids: Optional[IdDictionary] = None
+    rollup: Optional[Dict[str, pd.DataFrame]] = None
+    reviews: Optional[pd.DataFrame] = None  # Review grain for the CX views (df is one row per order)
 
 # --- SYSTEM INITIALIZATION -------------------------------------------------------------
 
@@ -1008,12 +1020,28 @@ def init_system() -> None:
     if 'analyzer' not in st.session_state:
         st.session_state.analyzer = ReviewAnalyzer()
 
+@st.cache_resource(show_spinner=False)
+def get_job_manager() -> JobManager:
+    """Process-wide enrichment queue: jobs outlive reruns, tab switches and reconnects."""
+    return JobManager(ReviewAnalyzer)
+
 @st.cache_data(show_spinner=False)
 def data_ingestion_pipeline(uploaded_files: Dict[str, Any]) -> ProcessingResult:
     """
     Core data processing pipeline.
     Uses caching to avoid re-computation on every frame render.
+    Complete uploads are also cached on disk by content hash, so identical
+    datasets are processed once per deployment instead of once per session.
     """
+    upload_key = None
+    if uploaded_files and len(uploaded_files) == 3:
+        upload_key = stream_digest(uploaded_files)
+        cached = UPLOAD_CACHE.get(upload_key)
+        if cached:
+            rollup = {k[len('rollup_'):]: v for k, v in cached.items() if k.startswith('rollup_')}
+            return ProcessingResult(cached['full_df'], cached['ltv_df'], cached['churn_df'], 0,
+                                    cached['payments_df'], cached['reviews_df'], IdDictionary.from_frames(cached), rollup)
+
     ingestor = DataIngestor()
     
     # Load Data (files mapped explicitly to expected keys)
@@ -1029,21 +1057,32 @@ def data_ingestion_pipeline(uploaded_files: Dict[str, Any]) -> ProcessingResult:
     if not raw_data:
         return ProcessingResult(None, None, None, 1) # Return Error Code
         
-    # Data Cleaning / Sanitization
+    # Data Cleaning / Sanitization (hex IDs -> int32 surrogate keys first)
     cleaner = DataCleaner()
-    orders_df = cleaner.clean_orders(raw_data['orders'])
-    reviews_df = cleaner.clean_reviews(raw_data['reviews'])
-    payments_df = raw_data['payments']
+    ids = IdDictionary()
+    orders_df, payments_df, reviews_df = cleaner.encode_keys(raw_data['orders'], raw_data['payments'], raw_data['reviews'], ids)
+    orders_df = cleaner.clean_orders(orders_df)
+    reviews_df = cleaner.clean_reviews(reviews_df)
     
-    # Merge Steps (Join Operations)
-    full_df = cleaner.merge_datasets(orders_df, payments_df, reviews_df)
+    # Merge Steps (Join Operations): one row per order, raw grains kept aside
+    full_df = cleaner.merge_datasets(orders_df, payments_df, reviews_df, grain="order")
+    reviews_df = cleaner.merge_datasets(orders_df, payments_df, reviews_df, grain="review")
     
     # Metric Calculation
     metrics = MetricsEngine()
     ltv_df = metrics.calculate_ltv(full_df)
     churn_df = metrics.calculate_churn_risk(orders_df)
+    rollup = metrics.build_rollup(full_df, churn_df)
     
-    return ProcessingResult(full_df, ltv_df, churn_df, 0) # OK
+    if upload_key and ingestor.source == "upload":
+        try:
+            UPLOAD_CACHE.put(upload_key, {'full_df': full_df, 'ltv_df': ltv_df, 'churn_df': churn_df,
+                                          'payments_df': payments_df, 'reviews_df': reviews_df, **ids.to_frames(),
+                                          **{f'rollup_{grain}': cube for grain, cube in rollup.items()}})
+        except Exception as e:
+            print(f"Upload cache write failed: {e}")
+    
+    return ProcessingResult(full_df, ltv_df, churn_df, 0, payments_df, reviews_df, ids, rollup) # OK
 
 # --- RENDERERS (V-TABLE PATTERN) -------------------------------------------------------
 
@@ -1054,15 +1093,14 @@ def render_dashboard(ctx: PageContext) -> None:
 
 
     
-    # Calculate KPIs
-    rev_total = ctx.df['payment_value'].sum() if 'payment_value' in ctx.df else 0.0
-    avg_tkt = ctx.df['payment_value'].mean() if 'payment_value' in ctx.df else 0.0
-    
-    active_cust_count = 0
-    if not ctx.churn.empty and 'is_active_30d' in ctx.churn.columns:
-        active_cust_count = ctx.churn[ctx.churn['is_active_30d'] == True].shape[0]
+    # Calculate KPIs (read from the precomputed rollup cube: O(periods), not O(rows))
+    cube = ctx.rollup or {}
+    totals = cube["all"].iloc[0] if "all" in cube else pd.Series(dtype=float)
     
-    total_cust = ctx.df['customer_id'].nunique()
+    rev_total = float(totals.get('revenue', 0.0))
+    avg_tkt = rev_total / max(1, totals.get('paid_orders', 0))
+    active_cust_count = int(totals.get('active_customers_30d', 0))
+    total_cust = int(totals.get('customers', 0))
     ratio_active = (active_cust_count / max(1, total_cust)) * 100
 
     # Display Kernel
@@ -1080,12 +1118,11 @@ def render_dashboard(ctx: PageContext) -> None:
     
     st.markdown("<div style='height: 20px'></div>", unsafe_allow_html=True)
     st.header("Desempenho Financeiro")
-    if 'order_purchase_timestamp' in ctx.df.columns:
+    if "day" in cube:
         # 1. Revenue Chart Logic
-        # Group by week to smooth out noise if dataset is large, otherwise day
-        daily_rev = ctx.df.groupby(ctx.df['order_purchase_timestamp'].dt.date)['payment_value'].sum().reset_index()
+        daily_rev = cube["day"]
         
-        fig = px.area(daily_rev, x='order_purchase_timestamp', y='payment_value', template="plotly_dark")
+        fig = px.area(daily_rev, x='period', y='revenue', template="plotly_dark")
         fig.update_layout(
             height=350,
             margin=dict(l=0, r=0, t=20, b=20),
@@ -1102,10 +1139,13 @@ def render_dashboard(ctx: PageContext) -> None:
 
     st.markdown("<div style='height: 30px'></div>", unsafe_allow_html=True)
     st.header("Composição e Distribuição")
-    if 'order_status' in ctx.df.columns:
+    status_cols = [c for c in totals.index if c.startswith('status_')]
+    if status_cols:
         # 1. Prepare Data
-        counts = ctx.df['order_status'].value_counts().reset_index()
-        counts.columns = ['status', 'count']
+        counts = pd.DataFrame({
+            'status': [c[len('status_'):] for c in status_cols],
+            'count': [int(totals[c]) for c in status_cols],
+        })
         
         status_map = {
             'delivered': 'Entregue', 'shipped': 'Enviado', 'canceled': 'Cancelado',
@@ -1201,26 +1241,29 @@ def render_dashboard(ctx: PageContext) -> None:
 def render_command_center(ctx: PageContext) -> None:
     """Renders the CX Command Center."""
     st.title("Experiência do Cliente")
+
+    # Review grain: an order can have several reviews (revenue views stay per order)
+    reviews = ctx.reviews if ctx.reviews is not None else ctx.df
     
     # 1. Metrics Header
     nps_proxy = "N/A"
-    if 'review_score' in ctx.df.columns:
-        promoters = len(ctx.df[ctx.df['review_score'] == 5])
-        detractors = len(ctx.df[ctx.df['review_score'] <= 3])
-        total = len(ctx.df)
+    if 'review_score' in reviews.columns:
+        promoters = len(reviews[reviews['review_score'] == 5])
+        detractors = len(reviews[reviews['review_score'] <= 3])
+        total = len(reviews)
         if total > 0:
             val = ((promoters - detractors) / total) * 100
             nps_proxy = f"{val:.0f}"
     
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("NPS (Estimado)", nps_proxy)
-    c2.metric("Reviews Totais", f"{len(ctx.df)}")
+    c2.metric("Reviews Totais", f"{len(reviews)}")
     
     # Pre-calculate counts for efficiency
-    pending_count = len(ctx.df[ctx.df['review_comment_message'].str.len() > 5])
+    pending_count = len(reviews[reviews['review_comment_message'].str.len() > 5])
     c3.metric("Fila de Análise", f"{pending_count}")
     
-    avg_score = ctx.df['review_score'].mean()
+    avg_score = reviews['review_score'].mean()
     c4.metric("Satisfação Média", f"{avg_score:.1f}/5.0")
     
     st.divider()
@@ -1235,12 +1278,12 @@ def render_command_center(ctx: PageContext) -> None:
     
     # Construct base view
     if is_filtered:
-        base_view = ctx.df[
-            (ctx.df['order_status'] == 'canceled') & 
-            (ctx.df['review_comment_message'].str.len() > 2)
+        base_view = reviews[
+            (reviews['order_status'] == 'canceled') & 
+            (reviews['review_comment_message'].str.len() > 2)
         ].drop_duplicates(subset=['review_comment_message']).copy()
     else:
-        base_view = ctx.df[ctx.df['review_comment_message'].str.len() > 2].drop_duplicates(subset=['review_comment_message']).copy()
+        base_view = reviews[reviews['review_comment_message'].str.len() > 2].drop_duplicates(subset=['review_comment_message']).copy()
     
     max_items = len(base_view)
     
@@ -1281,12 +1324,15 @@ def render_command_center(ctx: PageContext) -> None:
     # 3. Neural Processing Block
     if do_process and batch_qty > 0:
         _perform_neural_analysis(base_view, batch_qty, ctx.analyzer)
+
+    elif _attach_analysis_job():
+        _render_analysis_job()
     
     elif 'last_analysis' in st.session_state and not do_process:
         _render_last_analysis_table()
         
     st.divider()
-    _render_explorer(ctx.df)
+    _render_explorer(reviews, ctx.ids)
 
 def _perform_neural_analysis(df: pd.DataFrame, qty: int, analyzer: ReviewAnalyzer) -> None:
     """Helper: Executes the analysis loop."""
@@ -1294,42 +1340,119 @@ def _perform_neural_analysis(df: pd.DataFrame, qty: int, analyzer: ReviewAnalyze
 
         
         target = df.head(qty)
+
+        # Offline mode: the rule engine runs vectorized over the whole slice at once
+        if analyzer.mock_mode and analyzer.local_model is None:
+            start_t = time.time()
+            labels = analyzer.classify_series(target['review_comment_message'], target['review_score'])
+            enriched = target.copy()
+            enriched['Sentimento_IA'] = labels['sentiment']
+            enriched['Categoria_IA'] = labels['category']
+            enriched['Urgencia_IA'] = labels['urgency']
+            enriched['Acao_Sugerida'] = labels['suggested_action']
+            enriched['Origem_IA'] = 'rules'
+            st.session_state['last_analysis_status'] = f"Concluído em {time.time() - start_t:.1f}s! (modo offline, regras)"
+            status.update(label=st.session_state['last_analysis_status'], state="complete", expanded=True)
+            st.session_state['last_analysis'] = enriched
+            _render_last_analysis_table()
+            return
+
         # Convert to POD (Plain Old Data) for processing
         input_buffer = [{'text': r.review_comment_message, 'score': r.review_score} for r in target.itertuples()]
-        
-        st.write(f"Classificando {len(input_buffer)} avaliações...")
-        p_bar = st.progress(0)
-        
-        results = []
-        start_t = time.time()
-        
-        # Generator consumption loop
-        total = len(input_buffer)
-        for i, res in enumerate(analyzer.analyze_batch_with_progress(input_buffer, max_workers=8)):
-            results.append(res)
-            # Update GUI
-            p_bar.progress((i + 1) / total)
-            
-        elapsed = time.time() - start_t
-        status.update(label=f"Concluído em {elapsed:.1f}s!", state="complete", expanded=True)
-        
-        # Data Enrichment (Memory mapping)
-        enriched = target.copy()
-        enriched['Sentimento_IA'] = [r['sentiment'] for r in results]
-        enriched['Categoria_IA'] = [r['category'] for r in results]
-        enriched['Urgencia_IA'] = [r['urgency'] for r in results]
-        enriched['Acao_Sugerida'] = [r['suggested_action'] for r in results]
-        
-        # Persist to Session State (Heap)
-        st.session_state['last_analysis'] = enriched
-        
-        _render_last_analysis_table()
+
+        # A session follows one job: the one it replaces would keep spending API budget unobserved
+        jobs = get_job_manager()
+        if _attach_analysis_job():
+            jobs.cancel(st.session_state['analysis_job'])
+
+        # Runs on the process-level job queue; this session only follows its progress
+        job_id = jobs.submit(
+            input_buffer, context=target,
+            pack_size=PACK_SIZE, threshold=ROUTER_THRESHOLD, dedup=DEDUP_MAX_DISTANCE
+        )
+        st.session_state['analysis_job'] = job_id
+        st.query_params['job'] = job_id # Survives a reload (new session) of this tab
+        status.update(label=f"Enviado para a fila: {len(input_buffer)} avaliações", state="complete", expanded=False)
+
+    _render_analysis_job()
+
+def _attach_analysis_job() -> bool:
+    """Helper: True if this session follows a job; a reloaded tab reattaches through ?job=<id>."""
+    if 'analysis_job' not in st.session_state:
+        job_id = st.query_params.get('job')
+        if not job_id or get_job_manager().get(job_id) is None:
+            st.query_params.pop('job', None)
+            return False
+        st.session_state['analysis_job'] = job_id
+    return True
+
+def _drop_analysis_job() -> None:
+    """Helper: Stops following the session's job (the job itself is untouched)."""
+    st.session_state.pop('analysis_job', None)
+    st.query_params.pop('job', None)
+
+@st.fragment(run_every=1.0)
+def _render_analysis_job() -> None:
+    """Helper: Polls the session's enrichment job; publishes the results when it finishes."""
+    jobs = get_job_manager()
+    job_id = st.session_state.get('analysis_job')
+    snap = jobs.poll(job_id) if job_id else None
+    if snap is None:
+        _drop_analysis_job()
+        return
+
+    job = jobs.get(job_id)
+    stats = snap['stats']
+    if snap['status'] == DONE:
+        skipped = stats['routing']['skipped_share'] if stats.get('routing') else 0.0
+        collapsed = stats['dedup']['collapsed_share'] if stats.get('dedup') else 0.0
+        st.session_state['last_analysis_status'] = (
+            f"Concluído em {snap['elapsed']:.1f}s! (resolvidas por regras: {skipped:.0%} · "
+            f"duplicadas: {collapsed:.0%} · fallback: {stats['fallbacks']}/{snap['total']})"
+        )
+        # Data Enrichment (Memory mapping) -> Session State (Heap)
+        st.session_state['last_analysis'] = _enrich_rows(job.context, job.results)
+        _drop_analysis_job()
+        st.rerun()
+
+    labels = {QUEUED: "Na fila...", RUNNING: "Processando...", CANCELLED: "Cancelado", FAILED: "Falhou"}
+    st.write(f"{labels[snap['status']]} {snap['completed']}/{snap['total']} avaliações · {snap['elapsed']:.1f}s")
+    if snap['ahead']:
+        # One worker for the whole process (one API key): other sessions' jobs run first
+        st.caption(f"Posição na fila: {snap['ahead'] + 1} ({snap['ahead']} lote(s) à frente)")
+    st.progress(snap['progress'])
+    if snap['error']:
+        st.error(snap['error'])
+
+    c_cancel, c_resume = st.columns(2)
+    if snap['status'] in (QUEUED, RUNNING):
+        c_cancel.button("CANCELAR", on_click=jobs.cancel, args=(job_id,), use_container_width=True)
+    else:
+        c_resume.button("RETOMAR", on_click=jobs.resume, args=(job_id,), type="primary", use_container_width=True)
+        c_cancel.button("DESCARTAR", on_click=_drop_analysis_job, use_container_width=True)
+
+    if snap['completed']:
+        partial = _enrich_rows(job.context, job.results).dropna(subset=['Sentimento_IA'])
+        st.dataframe(partial[['review_score', 'review_comment_message', 'Sentimento_IA', 'Urgencia_IA']].tail(20), use_container_width=True)
+
+def _enrich_rows(target: pd.DataFrame, results: list) -> pd.DataFrame:
+    """Helper: Maps (possibly partial) analyzer results onto the target rows."""
+    enriched = target.copy()
+    pick = lambda key: [r[key] if r else None for r in results]
+    enriched['Sentimento_IA'] = pick('sentiment')
+    enriched['Categoria_IA'] = pick('category')
+    enriched['Urgencia_IA'] = pick('urgency')
+    enriched['Acao_Sugerida'] = pick('suggested_action')
+    enriched['Origem_IA'] = [r.get('provenance', {}).get('source') if r else None for r in results]
+    return enriched
 
 def _render_last_analysis_table() -> None:
     """Helper: Displays the results table."""
     if 'last_analysis' not in st.session_state: return
     
     st.subheader("Resultados da Análise")
+    if 'last_analysis_status' in st.session_state:
+        st.caption(st.session_state['last_analysis_status'])
     df = st.session_state['last_analysis']
     
     st.dataframe(
@@ -1344,8 +1467,8 @@ def _render_last_analysis_table() -> None:
         }
     )
 
-def _render_explorer(full_df: pd.DataFrame) -> None:
-    """Helper: Renders the Case Explorer section."""
+def _render_explorer(reviews: pd.DataFrame, ids: Optional[IdDictionary] = None) -> None:
+    """Helper: Renders the Case Explorer section (one row per review)."""
     st.subheader("Explorador de Dados")
     
     with st.expander("Filtros Avançados", expanded=False):
@@ -1353,17 +1476,21 @@ def _render_explorer(full_df: pd.DataFrame) -> None:
         term = f1.text_input("Buscar em comentários:", placeholder="Ex: atraso...")
         scores = f2.multiselect("Filtrar por Nota:", [1, 2, 3, 4, 5], default=[1, 2, 3, 4, 5])
         
-        stats = full_df["order_status"].unique().tolist() if "order_status" in full_df.columns else ["delivered"]
+        stats = reviews["order_status"].unique().tolist() if "order_status" in reviews.columns else ["delivered"]
         states = f3.multiselect("Status:", stats, default=stats[:1] if stats else [])
         
     # Filtering Pipeline
-    view = full_df.copy()
+    view = reviews.copy()
     if term and "review_comment_message" in view.columns:
         view = view[view["review_comment_message"].astype(str).str.contains(term, case=False, na=False)]
     if scores and "review_score" in view.columns:
         view = view[view["review_score"].isin(scores)]
     if states and "order_status" in view.columns:
         view = view[view["order_status"].isin(states)]
+
+    # Reverse lookup of the surrogate key, only for the rows being displayed
+    if ids is not None and "order_key" in view.columns:
+        view = view.assign(order_id=ids.decode("order_id", view["order_key"]))
         
     st.dataframe(
         view[["order_id", "order_status", "review_score", "review_comment_title", "review_comment_message", "order_purchase_timestamp"]],
@@ -1525,7 +1652,10 @@ def main() -> None:
         df=result.full_df, 
         ltv=result.ltv_df, 
         churn=result.churn_df,
-        analyzer=st.session_state.analyzer
+        analyzer=st.session_state.analyzer,
+        ids=result.ids,
+        rollup=result.rollup,
+        reviews=result.reviews_df
     )
 
     # 4. Dispatch Render
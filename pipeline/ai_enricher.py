@@ -1,10 +1,31 @@
 import os
 import json
 import time
-from groq import Groq
+import hashlib
+from groq import Groq, AsyncGroq, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 import re
+import queue
+import asyncio
+import threading
 import concurrent.futures
+from collections import Counter, deque
+import httpx
+import numpy as np
+import pandas as pd
+
+try:
+    from pipeline.result_store import EnrichmentStore
+    from pipeline.rate_limit import RateLimiter
+    from pipeline.lexicon import rule_hits, sanity_hits, fold_text, fold_series, RULE_LEXICONS, SANITY_LEXICONS, NEGATIVE_CATEGORIES, ADVERSATIVE
+    from pipeline.dedup import near_duplicate_groups
+    from pipeline.retry import RetryPolicy, EnrichmentError, DeadlineExceeded, Cancelled, ResponseParseError, classify_error, RATE_LIMITED
+except ImportError:  # Executed as a script (python pipeline/ai_enricher.py)
+    from result_store import EnrichmentStore
+    from rate_limit import RateLimiter
+    from lexicon import rule_hits, sanity_hits, fold_text, fold_series, RULE_LEXICONS, SANITY_LEXICONS, NEGATIVE_CATEGORIES, ADVERSATIVE
+    from dedup import near_duplicate_groups
+    from retry import RetryPolicy, EnrichmentError, DeadlineExceeded, Cancelled, ResponseParseError, classify_error, RATE_LIMITED
 
 # Load environment variables
 try:
@@ -12,45 +33,10 @@ try:
 except Exception as e:
     print(f"Warning: Could not load .env file: {e}")
 
-class ReviewAnalyzer:
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY")
-        self.mock_mode = False
-        self.client = None
-        
-        if self.api_key:
-            try:
-                self.client = Groq(api_key=self.api_key)
-            except Exception as e:
-                print(f"Error configuring Groq: {e}")
-                self.mock_mode = True
-        else:
-            print("WARNING: GROQ_API_KEY not found. Running in MOCK mode.")
-            self.mock_mode = True
+MODEL_NAME = "llama-3.3-70b-versatile"
 
-    def analyze_review(self, text, score=None):
-        """
-        Analyzes a single review text using Groq (LLaMA 3.3).
-        Returns a dict with sentiment, category, urgency, and suggested_action.
-        """
-        if not text or len(str(text)) < 2:
-             return {
-                "sentiment": "Neutral",
-                "category": "Unknown",
-                "urgency": "Baixa",
-                "suggested_action": "None"
-            }
-
-        result = None
-
-        # --- AI ARCHITECTURE ---
-        if not self.mock_mode:
-            try: # Outer try for safety
-                # Contexto da Nota (Ground Truth)
-                score_context = f"NOTA DADA: {score}/5" if score else "NOTA: Não informada"
-                
-                # Prompt Engineering
-                prompt = f"""
+# Prompt Engineering ({text} / {score_context} are filled per review)
+SYSTEM_PROMPT_TEMPLATE = """
                 ANALISE O TEXTO ABAIXO (PT-BR) E RETORNE UM JSON.
                 
                 TEXTO: "{text}"
@@ -76,62 +62,467 @@ class ReviewAnalyzer:
                 }}
                 """
 
-                chat_completion = self.client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "system", 
-                            "content": prompt
-                        },
-                        # --- FEW-SHOT EXAMPLES ---
-                        {
-                            "role": "user",
-                            "content": 'TEXTO: "Gostei, mas veio quebrado." NOTA: 1/5'
-                        },
-                        {
-                            "role": "assistant",
-                            "content": '{"sentiment": "Negativo", "category": "Logística", "urgency": "Alta", "suggested_action": "Troca Correta Imediata"}'
-                        },
-                        {
-                            "role": "user",
-                            "content": 'TEXTO: "Não tenho o que reclamar, tudo nos conformes." NOTA: 5/5'
-                        },
-                        {
-                            "role": "assistant",
-                            "content": '{"sentiment": "Positivo", "category": "Outro", "urgency": "Baixa", "suggested_action": "Agradecer Confiança"}'
-                        },
-                        # --- REAL INPUT ---
-                        {
-                            "role": "user",
-                            "content": f'TEXTO: "{text}"'
-                        }
-                    ],
-                    model="llama-3.3-70b-versatile",
-                    temperature=0.1,
-                    max_completion_tokens=512
-                )
-
-                response_content = chat_completion.choices[0].message.content
-                
-                # Cleanup common AI artifacts
-                clean_text = response_content.strip().replace('```json', '').replace('```', '')
+# --- FEW-SHOT EXAMPLES ---
+FEW_SHOT_MESSAGES = [
+    {
+        "role": "user",
+        "content": 'TEXTO: "Gostei, mas veio quebrado." NOTA: 1/5'
+    },
+    {
+        "role": "assistant",
+        "content": '{"sentiment": "Negativo", "category": "Logística", "urgency": "Alta", "suggested_action": "Troca Correta Imediata"}'
+    },
+    {
+        "role": "user",
+        "content": 'TEXTO: "Não tenho o que reclamar, tudo nos conformes." NOTA: 5/5'
+    },
+    {
+        "role": "assistant",
+        "content": '{"sentiment": "Positivo", "category": "Outro", "urgency": "Baixa", "suggested_action": "Agradecer Confiança"}'
+    },
+]
+
+# Packed mode: N reviews per request, answered as one JSON array keyed by index
+PACKED_SYSTEM_PROMPT = """
+                ANALISE CADA AVALIAÇÃO (PT-BR) DA LISTA E RETORNE UM JSON.
+                Cada item tem "i" (índice), "texto" e "nota" (1-5 ou null).
                 
-                # Extract JSON if there's text surrounding it
-                json_match = re.search(r'\{.*\}', clean_text, re.DOTALL)
-                if json_match:
-                    clean_text = json_match.group(0)
-                    
-                result = json.loads(clean_text)
+                REGRAS:
+                1. "Mas"/"Porém" inverte o sentimento (ex: "Bom, mas atrasou" = NEGATIVO).
+                2. "Não entregou"/"Extraviado" = URGÊNCIA ALTA.
+                3. "Não recomendo" = NEGATIVO.
+                4. Elogios ("Ótimo", "Amei") = POSITIVO.
+
+                AÇÕES SUGERIDAS:
+                - Logística -> "Verificar Rastreio"
+                - Produto -> "Autorizar Troca"
+                - Elogio -> "Fidelizar"
+
+                SAÍDA JSON OBRIGATÓRIA (um objeto por item, com o mesmo "i" da entrada):
+                {"results": [
+                    {"i": 0,
+                     "sentiment": "Positivo" | "Negativo" | "Neutro",
+                     "category": "Logística" | "Qualidade" | "Atendimento" | "Preço" | "Outro",
+                     "urgency": "Alta" | "Média" | "Baixa",
+                     "suggested_action": "Ação Curta (Max 3 palavras)"}
+                ]}
+                """
+
+PACKED_FEW_SHOT_MESSAGES = [
+    {
+        "role": "user",
+        "content": '[{"i": 0, "texto": "Gostei, mas veio quebrado.", "nota": 1}, {"i": 1, "texto": "Não tenho o que reclamar, tudo nos conformes.", "nota": 5}]'
+    },
+    {
+        "role": "assistant",
+        "content": '{"results": [{"i": 0, "sentiment": "Negativo", "category": "Logística", "urgency": "Alta", "suggested_action": "Troca Correta Imediata"}, {"i": 1, "sentiment": "Positivo", "category": "Outro", "urgency": "Baixa", "suggested_action": "Agradecer Confiança"}]}'
+    },
+]
+
+# Reviews per packed request: ~15x fewer calls, still well inside the output token budget
+PACK_SIZE = 15
+
+# Requests kept in flight by the asyncio engine (one thread, no worker pool);
+# the rate limiter's AIMD limit decides how much of this window is actually used
+ASYNC_MAX_IN_FLIGHT = 256
+
+# Optional static limits for the API key; the x-ratelimit-* headers calibrate them anyway
+GROQ_RPM = float(os.getenv("GROQ_RPM", 0)) or None
+GROQ_TPM = float(os.getenv("GROQ_TPM", 0)) or None
+
+# Alternative chat-completions endpoint, e.g. the local stub (python pipeline/stub_llm.py)
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+# Router: items whose rule-engine confidence reaches this skip the LLM (~50% of the corpus)
+ROUTER_THRESHOLD = 0.7
+
+# Near-duplicate collapsing: max SimHash Hamming distance (of 64 bits) between a
+# cluster member and its representative (whose answer the member receives)
+DEDUP_MAX_DISTANCE = 3
+
+VALID_SENTIMENTS = {"Positivo", "Negativo", "Neutro"}
+VALID_URGENCIES = {"Alta", "Média", "Baixa"}
+
+# Cache version tags: any prompt/few-shot/model change invalidates stored results
+PROMPT_VERSION = hashlib.sha256(
+    (MODEL_NAME + SYSTEM_PROMPT_TEMPLATE + json.dumps(FEW_SHOT_MESSAGES, ensure_ascii=False)).encode("utf-8")
+).hexdigest()[:12]
+PACKED_PROMPT_VERSION = hashlib.sha256(
+    (MODEL_NAME + PACKED_SYSTEM_PROMPT + json.dumps(PACKED_FEW_SHOT_MESSAGES, ensure_ascii=False)).encode("utf-8")
+).hexdigest()[:12]
+
+def _is_blank(text):
+    """Nothing to classify: None, NaN or under 2 characters."""
+    return not text or text != text or len(str(text)) < 2
+
+class ReviewAnalyzer:
+    def __init__(self, store=None, backend=None, base_url=None):
+        self.base_url = base_url or GROQ_BASE_URL
+        # A custom endpoint (local stub) needs no real key
+        self.api_key = os.getenv("GROQ_API_KEY") or ("local" if self.base_url else None)
+        self.mock_mode = False
+        self.client = None
+        self.async_client = None # Optional injected AsyncGroq-compatible client
+        self.store = store
+        self.api_calls = 0 # Chat completions issued by this instance
+        self.request_latencies = deque(maxlen=100_000) # Seconds per logical request (see _record_latency)
+        self.limiter = RateLimiter(rpm=GROQ_RPM, tpm=GROQ_TPM, max_concurrency=ASYNC_MAX_IN_FLIGHT)
+        self.retry_policy = RetryPolicy()
+        self.deadline = None # time.monotonic() cut-off for the running batch
+        self.cancelled = False # Set by cancel(): the running batch stops like at its deadline
+        self.outcomes = Counter() # Result provenance: llm / cache / rules / router / error:<kind>
+        self.routing = None # Last router report (see route)
+        self.dedup = None # Last near-duplicate report (see _collapsed)
+        self._stats_lock = threading.Lock()
+        
+        if self.api_key:
+            try:
+                # SDK retries off: 429s must reach our limiter, not be absorbed silently
+                self.client = Groq(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+            except Exception as e:
+                print(f"Error configuring Groq: {e}")
+                self.mock_mode = True
+        else:
+            print("WARNING: GROQ_API_KEY not found. Running in MOCK mode.")
+            self.mock_mode = True
+
+        # Local distilled model instead of per-review API calls (REVIEW_BACKEND=local)
+        self.local_model = None
+        if (backend or os.getenv("REVIEW_BACKEND", "llm")) == "local":
+            # Imported here: sklearn costs most of a cold start and only this backend needs it
+            try:
+                from pipeline.distill import DistilledClassifier
+            except ImportError:  # Executed as a script
+                from distill import DistilledClassifier
+            self.local_model = DistilledClassifier.load()
+            if self.local_model is None:
+                print("Warning: no distilled model found (run pipeline/distill.py); using the LLM backend.")
 
+        # Durable result store (only LLM answers are worth persisting; never a stub's)
+        if self.store is None and not self.mock_mode and not self.base_url:
+            try:
+                self.store = EnrichmentStore()
             except Exception as e:
-                # print(f"Error analyzing review with Groq: {e}")
-                pass
+                print(f"Warning: enrichment store unavailable: {e}")
+
+    def analyze_review(self, text, score=None):
+        """
+        Analyzes a single review text using Groq (LLaMA 3.3).
+        Returns a dict with sentiment, category, urgency, and suggested_action.
+        """
+        if _is_blank(text):
+             return self._with_provenance({
+                "sentiment": "Neutral",
+                "category": "Unknown",
+                "urgency": "Baixa",
+                "suggested_action": "None"
+            }, "rules")
+
+        if self.local_model is not None:
+            result = self.local_model.predict([text], [score])[0]
+            return self._finalize(result, score, text, "local")
+
+        result = None
+        retries, error = 0, None
+
+        # --- RESULT STORE (same text + score + prompt version = same answer) ---
+        store_key = None
+        if not self.mock_mode and self.store is not None:
+            store_key = self.store.make_key(text, score, PROMPT_VERSION)
+            cached = self.store.get(store_key)
+            if cached is not None:
+                return self._finalize(cached, score, text, "cache", version=PROMPT_VERSION)
+
+        # --- AI ARCHITECTURE ---
+        if not self.mock_mode:
+            try:
+                result, retries = self._call_llm(text, score)
+                if result and store_key:
+                    # Persist the raw answer; sanity checks are re-applied on every read
+                    self.store.put(store_key, result, PROMPT_VERSION, text=text, score=score)
+            except EnrichmentError as e:
+                retries, error = e.retries, e.kind
 
         # --- FALLBACK / SAFETY NET ---
+        source = "llm"
         if not result:
             result = self._rule_based_analysis(text)
+            source = "rules"
 
         # --- SANITY CHECK LAYER (Applied to BOTH AI and Rule-Based) ---
-        return self._apply_sanity_checks(result, score, text)
+        return self._finalize(result, score, text, source, retries, error, PROMPT_VERSION if source == "llm" else None)
+
+    def _finalize(self, raw, score, text, source, retries=0, error=None, version=None):
+        """Sanity checks on a copy of `raw`, then provenance (which keeps `raw` for fan-out)."""
+        result = self._apply_sanity_checks(dict(raw), score, text)
+        return self._with_provenance(result, source, retries, error, raw=raw, version=version)
+
+    def _with_provenance(self, result, source, retries=0, error=None, raw=None, version=None):
+        """
+        Tags a final result with where it came from (llm / cache / rules / router /
+        local / dedup) and the prompt version that produced its answer (None when
+        no prompt did).
+        """
+        result["provenance"] = {"source": source, "retries": retries, "error": error, "raw": raw, "prompt_version": version}
+        with self._stats_lock:
+            self.outcomes[source] += 1
+            if error:
+                self.outcomes[f"error:{error}"] += 1
+        return result
+
+    def _from_store(self, raw, item):
+        return self._finalize(raw, item.get('score'), item['text'], "cache", version=PROMPT_VERSION)
+
+    def fallback_rate(self):
+        """
+        Share of non-trivial results that ended in the rules engine after an LLM
+        error. Both sides count results (one per review): a failed cluster adds
+        every member to the errors, a successful one every member to the total.
+        """
+        with self._stats_lock:
+            errors = sum(n for k, n in self.outcomes.items() if k.startswith("error:"))
+            answered = sum(self.outcomes[source] for source in ("llm", "cache", "dedup", "local"))
+            total = answered + errors
+        return errors / total if total else 0.0
+
+    def _build_messages(self, text, score):
+        # Contexto da Nota (Ground Truth)
+        score_context = f"NOTA DADA: {score}/5" if score else "NOTA: Não informada"
+        prompt = SYSTEM_PROMPT_TEMPLATE.format(text=text, score_context=score_context)
+        return [
+            {
+                "role": "system", 
+                "content": prompt
+            },
+            *FEW_SHOT_MESSAGES,
+            # --- REAL INPUT ---
+            {
+                "role": "user",
+                "content": f'TEXTO: "{text}"'
+            }
+        ]
+
+    @staticmethod
+    def _parse_response(response_content):
+        # Cleanup common AI artifacts
+        clean_text = response_content.strip().replace('```json', '').replace('```', '')
+        
+        # Extract JSON if there's text surrounding it
+        json_match = re.search(r'\{.*\}', clean_text, re.DOTALL)
+        if json_match:
+            clean_text = json_match.group(0)
+            
+        return json.loads(clean_text)
+
+    def _call_llm(self, text, score):
+        """One chat completion for one review; returns (parsed JSON dict, retries)."""
+        return self._send(self._build_messages(text, score), 512, self._parse_response)
+
+    @staticmethod
+    def _estimate_tokens(messages, max_completion_tokens):
+        # ~3 chars per token for PT-BR prompts; answers use a fraction of the cap
+        return sum(len(m["content"]) for m in messages) // 3 + max_completion_tokens // 4
+
+    def _send(self, messages, max_completion_tokens, parse):
+        """
+        Chat completion under the retry policy: waits on the rate limiter, feeds it
+        the response headers, and retries retryable / rate-limited / parse errors
+        with backoff until the policy or the batch deadline says stop.
+        Returns (parse(content), retries); raises EnrichmentError otherwise.
+        """
+        estimate = self._estimate_tokens(messages, max_completion_tokens)
+        attempt = 0
+        started = time.monotonic()
+        try:
+            while True:
+                sent_at = None
+                try:
+                    self._check_deadline()
+                    self.limiter.acquire(estimate)
+                    try:
+                        self._count_call()
+                        sent_at = time.monotonic()
+                        raw = self.client.chat.completions.with_raw_response.create(
+                            messages=messages,
+                            model=MODEL_NAME,
+                            temperature=0.1,
+                            max_completion_tokens=max_completion_tokens,
+                            timeout=self.retry_policy.timeout
+                        )
+                        self.limiter.on_response(raw.headers)
+                        return self._parse_completion(parse, raw.parse()), attempt
+                    finally:
+                        self.limiter.release()
+                except Exception as e:
+                    kind = self._on_error(e, attempt, sent_at)
+                time.sleep(self._backoff(kind, attempt))
+                attempt += 1
+        finally:
+            self._record_latency(started)
+
+    @staticmethod
+    def _parse_completion(parse, completion):
+        """parse(answer text); a malformed answer raises ResponseParseError (retried as PARSE)."""
+        try:
+            return parse(completion.choices[0].message.content)
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:  # JSONDecodeError is a ValueError
+            raise ResponseParseError(f"{type(e).__name__}: {e}") from e
+
+    def _check_deadline(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise Cancelled() if self.cancelled else DeadlineExceeded()
+
+    def cancel(self):
+        """Stops the running batch: requests not yet answered give up at their next attempt."""
+        self.cancelled = True
+        self.deadline = time.monotonic()
+
+    def _on_error(self, exc, attempt, sent_at=None):
+        """Classifies a failed attempt; raises EnrichmentError when it must not be retried."""
+        kind = classify_error(exc)
+        if kind == RATE_LIMITED:
+            self.limiter.on_throttle(exc.response.headers, sent_at)
+        if not self.retry_policy.should_retry(kind, attempt):
+            raise EnrichmentError(kind, attempt, exc) from exc
+        return kind
+
+    def _backoff(self, kind, attempt):
+        delay = self.retry_policy.backoff(kind, attempt)
+        if self.deadline is not None:
+            delay = max(0.0, min(delay, self.deadline - time.monotonic()))
+        return delay
+
+    def _count_call(self):
+        with self._stats_lock:
+            self.api_calls += 1
+
+    def _record_latency(self, started):
+        """Submit -> complete time of one request, retries and limiter waits included."""
+        with self._stats_lock:
+            self.request_latencies.append(time.monotonic() - started)
+
+    @staticmethod
+    def _validate_item(obj):
+        """Returns a clean result dict if `obj` has the required fields and values, else None."""
+        if not isinstance(obj, dict):
+            return None
+        if obj.get("sentiment") not in VALID_SENTIMENTS or obj.get("urgency") not in VALID_URGENCIES:
+            return None
+        if not isinstance(obj.get("category"), str) or not isinstance(obj.get("suggested_action"), str):
+            return None
+        return {k: obj[k] for k in ("sentiment", "category", "urgency", "suggested_action")}
+
+    @staticmethod
+    def _build_packed_messages(items):
+        payload = [
+            {"i": i, "texto": str(text), "nota": int(float(score)) if score and score == score else None}
+            for i, text, score in items
+        ]
+        return [
+            {"role": "system", "content": PACKED_SYSTEM_PROMPT},
+            *PACKED_FEW_SHOT_MESSAGES,
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+        ]
+
+    def _parse_packed_response(self, response_content, items):
+        """Returns {i: result} for the items whose answer parsed and validated."""
+        clean_text = response_content.strip().replace('```json', '').replace('```', '')
+        json_match = re.search(r'[\[{].*[\]}]', clean_text, re.DOTALL)
+        parsed = json.loads(json_match.group(0) if json_match else clean_text)
+        entries = parsed.get("results", []) if isinstance(parsed, dict) else parsed
+
+        wanted = {i for i, _, _ in items}
+        results = {}
+        for entry in entries if isinstance(entries, list) else []:
+            index = entry.get("i") if isinstance(entry, dict) else None
+            valid = self._validate_item(entry)
+            if isinstance(index, int) and index in wanted and valid:
+                results[index] = valid
+        return results
+
+    def _call_llm_packed(self, items):
+        """
+        One chat completion for several reviews. `items` is a list of (i, text, score);
+        returns ({i: result} for the items whose answer parsed and validated, retries).
+        """
+        return self._send(
+            self._build_packed_messages(items), 100 + 80 * len(items),
+            lambda content: self._parse_packed_response(content, items),
+        )
+
+    def analyze_pack(self, reviews_data, retries=1):
+        """
+        Classifies a list of {'text', 'score'} items with a single request.
+        Items whose answer is missing or invalid are re-packed (only those) up to
+        `retries` times, then sent one by one through analyze_review.
+        Returns results in input order.
+        """
+        results, raw, keys, cached = self._pack_prepare(reviews_data)
+        tries, spent = {}, 0
+
+        for round_no in range(retries + 1):
+            pending = [i for i in raw if results[i] is None]
+            if not pending:
+                break
+            try:
+                parsed, call_retries = self._call_llm_packed([(i, reviews_data[i]['text'], reviews_data[i].get('score')) for i in pending])
+            except EnrichmentError as e:
+                parsed, call_retries = {}, e.retries
+            spent += call_retries + (1 if round_no else 0)
+            self._pack_absorb(reviews_data, results, keys, parsed, tries, spent)
+
+        for i in [i for i in raw if results[i] is None]:
+            raw.discard(i)
+            results[i] = self.analyze_review(reviews_data[i]['text'], score=reviews_data[i].get('score')) # Single-call fallback
+        return self._pack_finish(reviews_data, results, raw, cached, tries)
+
+    def _pack_prepare(self, reviews_data):
+        """
+        Shared first step of the packed paths. Returns (results, raw, keys, cached):
+        final results for trivial items, stored raw answers, the set of indices
+        that still need (or hold) a raw LLM answer, their packed store keys and
+        {index: prompt version} for the items served from the store.
+        """
+        results = [None] * len(reviews_data)
+        raw = set()
+        for i, item in enumerate(reviews_data):
+            text = item['text']
+            if self.mock_mode or _is_blank(text):
+                results[i] = self.analyze_review(text, score=item.get('score'))
+            else:
+                raw.add(i)
+
+        # Result store: packed answers have their own version tag, but items that
+        # fell back to single calls earlier are stored under PROMPT_VERSION
+        keys, cached = {}, {}
+        if raw and self.store is not None:
+            keys = {i: self.store.make_key(reviews_data[i]['text'], reviews_data[i].get('score'), PACKED_PROMPT_VERSION) for i in raw}
+            single = {i: self.store.make_key(reviews_data[i]['text'], reviews_data[i].get('score'), PROMPT_VERSION) for i in raw}
+            found = self.store.get_many(list(set(keys.values()) | set(single.values())))
+            for i in raw:
+                packed_hit = found.get(keys[i])
+                hit = packed_hit or found.get(single[i])
+                if hit:
+                    results[i] = dict(hit)
+                    cached[i] = PACKED_PROMPT_VERSION if packed_hit else PROMPT_VERSION
+        return results, raw, keys, cached
+
+    def _pack_absorb(self, reviews_data, results, keys, parsed, tries, spent):
+        for i, result in parsed.items():
+            results[i] = result
+            tries[i] = spent
+            if i in keys:
+                item = reviews_data[i]
+                self.store.put(keys[i], result, PACKED_PROMPT_VERSION, text=item['text'], score=item.get('score'))
+
+    def _pack_finish(self, reviews_data, results, raw, cached, tries):
+        for i in raw:
+            item = reviews_data[i]
+            if i in cached:
+                results[i] = self._finalize(results[i], item.get('score'), item['text'], "cache", version=cached[i])
+            else:
+                results[i] = self._finalize(results[i], item.get('score'), item['text'], "llm", tries.get(i, 0), version=PACKED_PROMPT_VERSION)
+        return results
 
     def _apply_sanity_checks(self, result, score, text_raw):
         """
@@ -143,6 +534,7 @@ class ReviewAnalyzer:
             
         try:
             score_int = int(float(score))
+            hits = sanity_hits(text_raw)
             
             # Initialize reasoning if not present
             if "reasoning" not in result:
@@ -172,20 +564,15 @@ class ReviewAnalyzer:
                     result["urgency"] = "Média" # Upgrade automático
                 
                 # Upgrade para Alta se houver palavras-gatilho
-                triggers_alta = [
-                    "atraso", "não recebi", "extraviado", "quebrado", "defeito", "procon", "justiça",
-                    "triste", "decepcionado", "chateado", "nunca mais", "indignado", "vergonha", "absurdo", "lixo"
-                ]
-                if any(t in text_raw.lower() for t in triggers_alta):
+                if "urgency_alta" in hits:
                     result["urgency"] = "Alta"
-                    if "triste" in text_raw.lower() or "decepcionado" in text_raw.lower():
+                    if "acolhimento" in hits:
                         result["suggested_action"] = "Acolhimento + Solução"
                     else:
                         result["suggested_action"] = "Resolução Imediata / Estorno"
 
             # 4. Positive Lexicon Override
-            triggers_positive = ["parabéns", "excelente", "perfeito", "amei", "recomendo", "ótimo", "maravilhoso"]
-            if any(t in text_raw.lower() for t in triggers_positive):
+            if "positive" in hits:
                     if score_int >= 4: 
                         result["sentiment"] = "Positivo"
                         result["category"] = "Outro" if result.get("category") == "Unknown" else result.get("category")
@@ -197,132 +584,527 @@ class ReviewAnalyzer:
         return result
 
     def _rule_based_analysis(self, text):
-        """High-precision regex logic for fallback or offline mode."""
-        text_lower = text.lower()
-        import unicodedata
-        normalized = "".join(c for c in unicodedata.normalize("NFKD", text_lower) if not unicodedata.combining(c))
-        
-        # Dicionário de Crimes (Negativos)
-        neg_triggers = {
-            "urgency_high": ["processo", "procon", "justiça", "advogado", "nunca mais", "lixo", "golpe", "roubo"],
-            "logistics": ["atraso", "demorou", "nao chegou", "extraviado", "sumiu", "correios", "entrega"],
-            "quality": ["quebrado", "defeito", "falha", "estragado", "pior", "horrivel", "falsificado"],
-            "support": ["grosso", "mal educado", "ignora", "descaso", "atendimento", "sac"]
-        }
-        
+        """High-precision lexicon logic for fallback or offline mode (one compiled scan per text)."""
+        hits = rule_hits(text)
+
         # FIX: Check for "não recomendo" explicitly
-        if "nao recomendo" in normalized or "nao indico" in normalized:
+        if "not_recommended" in hits:
              return {"sentiment": "Negativo", "category": "Qualidade", "urgency": "Média", "suggested_action": "Monitorar"}
 
         # 1. Check Critical Urgency
-        if any(w in normalized for w in neg_triggers["urgency_high"]):
+        if "urgency_high" in hits:
             return {"sentiment": "Negativo", "category": "Outro", "urgency": "Alta", "suggested_action": "Reter Cliente Imediatamente"}
             
         # 2. Check Logistics
-        if any(w in normalized for w in neg_triggers["logistics"]):
+        if "logistics" in hits:
              return {"sentiment": "Negativo", "category": "Logística", "urgency": "Alta", "suggested_action": "Verificar Rastreio"}
              
         # 3. Check General Negative
-        general_bad = ["ruim", "pessimo", "terrivel", "odiei", "triste", "insatisfeito"]
-        if any(w in normalized for w in general_bad):
+        if "general_bad" in hits:
              return {"sentiment": "Negativo", "category": "Qualidade", "urgency": "Média", "suggested_action": "Oferecer Cupom/Troca"}
              
         # 4. Positives
-        positives = ["bom", "otimo", "excelente", "amei", "gostei", "recomendo", "top", "show", "perfeito"]
-        if any(w in normalized for w in positives):
+        if "positive" in hits:
              return {"sentiment": "Positivo", "category": "Qualidade", "urgency": "Baixa", "suggested_action": "Agradecer Review"}
 
         return {"sentiment": "Neutro", "category": "Outro", "urgency": "Baixa", "suggested_action": "Monitorar"}
 
+    # Rule engine outcomes, in priority order: (lexicon, sentiment, category, urgency, action)
+    RULE_TABLE = [
+        ("not_recommended", "Negativo", "Qualidade", "Média", "Monitorar"),
+        ("urgency_high", "Negativo", "Outro", "Alta", "Reter Cliente Imediatamente"),
+        ("logistics", "Negativo", "Logística", "Alta", "Verificar Rastreio"),
+        ("general_bad", "Negativo", "Qualidade", "Média", "Oferecer Cupom/Troca"),
+        ("positive", "Positivo", "Qualidade", "Baixa", "Agradecer Review"),
+    ]
+    RULE_DEFAULT = ("Neutro", "Outro", "Baixa", "Monitorar")
+
+    def classify_series(self, messages, scores):
+        """
+        Vectorized offline classification of a whole review column: the rule
+        engine plus the score sanity matrix, with string ops and NumPy masks
+        instead of a per-row analyze_review loop. Same labels as the per-row
+        rule path. Returns a DataFrame (same index) of categorical columns
+        sentiment / category / urgency / suggested_action.
+        """
+        messages = messages.astype("string[pyarrow]")
+        empty = (messages.str.len().fillna(0) < 2).to_numpy()
+
+        # --- Rule engine: first matching lexicon wins ---
+        folded = fold_series(messages)
+        conditions = [RULE_LEXICONS.contains(folded, name) for name, *_ in self.RULE_TABLE]
+        sentiment, category, urgency, action = (
+            np.select(conditions, [row[field] for row in self.RULE_TABLE], default=self.RULE_DEFAULT[field - 1]).astype(object)
+            for field in range(1, 5)
+        )
+
+        # --- Sanity matrix (only rows with a usable score) ---
+        score = pd.to_numeric(scores, errors="coerce").to_numpy(dtype=float)
+        checked = ~empty & ~np.isnan(score) & (score != 0)
+        score = np.where(checked, np.trunc(np.nan_to_num(score)), 0)
+
+        lowered = messages.str.lower()
+        alta = SANITY_LEXICONS.contains(lowered, "urgency_alta")
+        acolhimento = SANITY_LEXICONS.contains(lowered, "acolhimento")
+        positive = SANITY_LEXICONS.contains(lowered, "positive")
+
+        neutral = checked & (sentiment == "Neutro")
+        sentiment[neutral & (score <= 3)] = "Negativo"
+        category[neutral & (score <= 3)] = "Qualidade"
+        sentiment[neutral & (score >= 4)] = "Positivo"
+
+        sentiment[checked & (score <= 2)] = "Negativo"
+        sentiment[checked & (score == 5)] = "Positivo"
+
+        negative = checked & (sentiment == "Negativo")
+        urgency[negative & (urgency == "Baixa")] = "Média"
+        urgency[negative & alta] = "Alta"
+        action[negative & alta] = np.where(acolhimento[negative & alta], "Acolhimento + Solução", "Resolução Imediata / Estorno")
+
+        praised = checked & positive & (score >= 4)
+        sentiment[praised] = "Positivo"
+        category[praised & (category == "Unknown")] = "Outro"
+        action[praised] = "Agradecer e Fidelizar"
+
+        # --- Empty reviews bypass both layers ---
+        sentiment[empty], category[empty], urgency[empty], action[empty] = "Neutral", "Unknown", "Baixa", "None"
+
+        return pd.DataFrame({
+            "sentiment": pd.Categorical(sentiment),
+            "category": pd.Categorical(category),
+            "urgency": pd.Categorical(urgency),
+            "suggested_action": pd.Categorical(action),
+        }, index=messages.index)
+
+    def rule_confidence(self, text, score=None):
+        """
+        0-1 confidence that the rule engine (plus sanity checks) already gives the
+        right answer: unambiguous lexicon hits, a score that agrees with them,
+        short text, no adversative turn.
+        """
+        hits = rule_hits(text)
+        negative = bool(hits & NEGATIVE_CATEGORIES)
+        positive = "positive" in hits
+        if negative and positive:
+            lexicon = 0.2
+        elif negative or positive:
+            lexicon = 1.0
+        else:
+            lexicon = 0.4
+
+        try:
+            score_int = int(float(score)) or None
+        except (TypeError, ValueError):
+            score_int = None
+
+        # Extreme scores already fix the sentiment in the sanity layer
+        polarity = "Negativo" if negative and not positive else "Positivo" if positive and not negative else None
+        if score_int is None or score_int == 3:
+            agreement = 0.5
+        elif polarity is None:
+            agreement = 0.9 if score_int >= 4 else 0.4 # Short praise is easy; complaints need a category
+        elif (score_int >= 4) == (polarity == "Positivo"):
+            agreement = 1.0
+        else:
+            agreement = 0.0
+
+        length = len(str(text))
+        brevity = 1.0 if length <= 40 else max(0.0, 1 - (length - 40) / 160)
+
+        confidence = 0.4 * lexicon + 0.35 * agreement + 0.25 * brevity
+        if ADVERSATIVE.search(fold_text(text)):
+            confidence *= 0.6
+        return confidence
+
+    def route(self, reviews_data, threshold=ROUTER_THRESHOLD):
+        """
+        Splits a batch before any API call. Returns ({index: final result} for
+        empty and high-confidence items, [indices] left for the LLM) and records
+        the skipped share in self.routing.
+        """
+        routed, pending = {}, []
+        for i, item in enumerate(reviews_data):
+            text, score = item['text'], item.get('score')
+            if _is_blank(text):
+                routed[i] = self.analyze_review(text, score=score)
+            elif self.rule_confidence(text, score) >= threshold:
+                routed[i] = self._finalize(self._rule_based_analysis(text), score, text, "router")
+            else:
+                pending.append(i)
+
+        total = len(reviews_data)
+        self.routing = {
+            "threshold": threshold,
+            "total": total,
+            "skipped": len(routed),
+            "skipped_share": len(routed) / total if total else 0.0,
+        }
+        return routed, pending
+
+    def _staged(self, reviews_data, threshold, dedup, engine):
+        """
+        Batch stages ahead of `engine` (an (index, result) generator): the
+        confidence router, then near-duplicate collapsing, on what is left.
+        The local backend skips collapsing: its predictions cost less than clustering.
+        """
+        if self.local_model is not None:
+            engine = self._local_as_completed
+            dedup = None
+            self.dedup = None
+        if dedup is not None:
+            engine = lambda items, engine=engine: self._collapsed(items, dedup, engine)
+        if threshold is None:
+            yield from engine(reviews_data)
+            return
+        routed, pending = self.route(reviews_data, threshold)
+        yield from routed.items()
+        for j, result in engine([reviews_data[i] for i in pending]):
+            yield pending[j], result
+
+    def _collapsed(self, reviews_data, max_distance, engine):
+        """
+        Sends one representative per near-duplicate cluster to `engine` and fans
+        its raw answer out to the other members, each with its own sanity checks
+        (members keep their own score). When the representative's request failed,
+        members fall back to rules with the same error. Records the collapsed
+        share in self.dedup.
+        """
+        live = [i for i, item in enumerate(reviews_data) if not _is_blank(item['text'])]
+        groups = near_duplicate_groups([reviews_data[i]['text'] for i in live], max_distance=max_distance)
+        rep_of = list(range(len(reviews_data)))
+        for position, i in enumerate(live):
+            rep_of[i] = live[groups[position]]
+
+        members = {}
+        for i, rep in enumerate(rep_of):
+            members.setdefault(rep, []).append(i)
+        reps = list(members)
+        sent = len(set(groups))
+        self.dedup = {
+            "max_distance": max_distance,
+            "texts": len(live),
+            "sent": sent,
+            "collapsed_share": 1 - sent / len(live) if live else 0.0,
+        }
+
+        for j, result in engine([reviews_data[rep] for rep in reps]):
+            rep = reps[j]
+            yield rep, result
+            provenance = result.get("provenance", {})
+            raw = provenance.get("raw")
+            for i in members[rep]:
+                if i == rep:
+                    continue
+                item = reviews_data[i]
+                if provenance.get("error"):
+                    # The LLM failed for the whole cluster: each member falls back on
+                    # its own text and carries the error, so fallbacks stay counted
+                    yield i, self._finalize(
+                        self._rule_based_analysis(item['text']), item.get('score'), item['text'],
+                        provenance["source"], provenance.get("retries", 0), provenance["error"],
+                    )
+                elif raw is None:
+                    yield i, self.analyze_review(item['text'], score=item.get('score'))
+                else:
+                    yield i, self._finalize(raw, item.get('score'), item['text'], "dedup", version=provenance.get("prompt_version"))
+
+    def _local_as_completed(self, reviews_data, chunk_size=5000):
+        """Local backend: vectorized predictions, no network."""
+        for start in range(0, len(reviews_data), chunk_size):
+            chunk = reviews_data[start:start + chunk_size]
+            live = [i for i, item in enumerate(chunk) if not _is_blank(item['text'])]
+            predicted = self.local_model.predict([chunk[i]['text'] for i in live], [chunk[i].get('score') for i in live]) if live else []
+            for i, result in zip(live, predicted):
+                item = chunk[i]
+                yield start + i, self._finalize(result, item.get('score'), item['text'], "local")
+            for i in set(range(len(chunk))) - set(live):
+                yield start + i, self.analyze_review(chunk[i]['text'], score=chunk[i].get('score'))
+
     def batch_analyze(self, texts):
         results = []
         for text in texts:
-            results.append(self.analyze_review(text))
-            if not self.mock_mode:
-                time.sleep(0.5) 
+            results.append(self.analyze_review(text)) # Pacing is the rate limiter's job
         return results
 
     analyze_batch_concurrent = None # Deprecated/Replaced in usage but kept signature if needed
     
-    def analyze_batch_with_progress(self, reviews_data, max_workers=5):
+    def analyze_batch_with_progress(self, reviews_data, max_workers=5, pack_size=1, deadline=None, threshold=None, dedup=None):
         """
-        Generator that yields results as they complete for real-time progress bars.
+        Generator that yields results in input order (row alignment with the caller's frame).
+        pack_size > 1 sends that many reviews per request (see analyze_pack).
+        deadline (seconds) caps the whole batch: past it, remaining items use the rules engine.
+        threshold enables the confidence router (see route): confident items skip the LLM.
+        dedup (max SimHash distance) sends one review per near-duplicate cluster (see _collapsed).
         """
-        # We need to map future back to index to maintain order? 
-        # Actually for progress bar we just need "a result happened".
-        # But we need final results essentially ordered or at least mapped.
-        
-        # To keep it simple and safe: We yield (index, result) so caller can reconstruct if needed,
-        # OR caller just appends. Since we are enriching a slice, order matters if we just append?
-        # Concurrent futures doesn't guarantee order. 
-        # Let's yield just the result, but wait... if we just append to list in main loop, 
-        # we might lose alignment with the original dataframe rows if we aren't careful.
-        
-        # FIX: We will return results OUT OF ORDER primarily, but we need to reorder them?
-        # Or we act simpler: We are processing a list. 
-        # The main.py code just appends to `enrichment_data`.
-        # If `as_completed` yields out of order, the `enrichment_data` will be shuffled 
-        # relative to `demo_subset`. THIS IS A BUG Risk.
-        
-        # Safe Strategy:
-        # We handle the futures. We yield "Progress" but we collect Results internally? 
-        # No, that blocks.
-        
-        # Better Strategy:
-        # Helper returns yield.
-        # But we must yield (index, result). Main.py should handle reassembly or we handle it here
-        # and just yield "tick".
-        
-        # Let's stick to the current main.py implementation which expects `result`
-        # BUT we must ensure main.py handles the order? 
-        # main.py does: `results.append(result)`. This WILL be out of order if we use as_completed.
-        # This breaks row alignment.
-        
-        # CRITICAL FIX: we must ensure results are ordered or return (index, result).
-        # I will return (index, result) and update main.py to handle it?
-        # OR I make this generator yield strictly in order?
-        # If I yield in order, I block on earlier items.
-        
-        # compromise: Use as_completed to drive progress, but store results in a dict/list 
-        # and re-sort at the end or yield (index, result).
-        # I cannot change main.py indiscriminately.
-        # Let's look at main.py again. It does `enrichment_data = results`. 
-        # And assumes `enriched_subset` (which is `demo_subset`) matches row-by-row.
-        # So `results` MUST be in order.
-        
-        # Solution:
-        # We cannot use `as_completed` for yielding results individually IF we want order,
-        # UNLESS we yield (i, res) and main.py puts it in `results[i]`.
-        
-        # Let's fix loop in main.py? I already wrote main.py to append.
-        # So I will change this function to yield (index, result) tuple? No, existing code expects `r['sentiment']`.
-        
-        # WAIT. If I use `executor.map`, it preserves order! 
-        # But `map` blocks until results are ready? No, `map` returns an iterator that yields results in order
-        # as they become available? NO, it yields in order, so if item 0 is slow, it blocks item 1.
-        # BUT it allows progress to update as long as items 0,1,2... complete.
-        # This is acceptable for a progress bar (it might stutter but it works).
-        
-        # Let's use `executor.map` wrapper logic?
-        # Actually, `as_completed` is better for "liveness".
-        # I will change the main.py logic to handle reordering? 
-        # Too many changes.
-        
-        # Simplest Fix for User's "Buggy Bar":
-        # Just use `map`. It preserves order. It might stall if #1 is slow, but usually API calls are similar text -> similar time.
-        # It's better than `as_completed` breaking the data alignment.
-        
+        yield from self._in_order(
+            self.analyze_batch_as_completed(reviews_data, max_workers, pack_size, deadline, threshold, dedup), len(reviews_data)
+        )
+
+    def analyze_batch_as_completed(self, reviews_data, max_workers=5, pack_size=1, deadline=None, threshold=None, dedup=None):
+        """
+        Generator of (index, result) pairs in completion order, so one slow request
+        never holds back the ones that already finished. Callers place results by index.
+        """
+        self.deadline = time.monotonic() + deadline if deadline else None
+        self.cancelled = False
+        yield from self._staged(
+            reviews_data, threshold, dedup, lambda items: self._pool_as_completed(items, max_workers, pack_size)
+        )
+
+    def _pool_as_completed(self, reviews_data, max_workers, pack_size):
+        # Result store first: one bulk lookup, only misses reach the executor
+        cached = {} if pack_size > 1 else self._store_lookup(reviews_data)
+        for i, raw in cached.items():
+            yield i, self._from_store(raw, reviews_data[i])
+
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Prepare args
-            futures = [
-                executor.submit(self.analyze_review, item['text'], score=item.get('score')) 
-                for item in reviews_data
-            ]
-            
-            # We want to yield results IN ORDER to preserve dataframe alignment
-            # This means the progress bar will move as the "slowest previous task" completes.
-            for future in futures:
-                yield future.result()
+            if pack_size > 1 and not self.mock_mode:
+                futures = {
+                    executor.submit(self.analyze_pack, reviews_data[start:start + pack_size]): start
+                    for start in range(0, len(reviews_data), pack_size)
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    for offset, result in enumerate(future.result()):
+                        yield futures[future] + offset, result
+                return
+
+            futures = {
+                executor.submit(self.analyze_review, item['text'], score=item.get('score')): i
+                for i, item in enumerate(reviews_data) if i not in cached
+            }
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], future.result()
+
+    @staticmethod
+    def _in_order(pairs, total):
+        """Re-sequences (index, result) pairs into a plain in-order stream of results."""
+        buffered = {}
+        next_index = 0
+        for index, result in pairs:
+            buffered[index] = result
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+        if next_index != total:
+            raise RuntimeError(f"Batch ended after {next_index} of {total} results")
+
+    def _store_lookup(self, reviews_data):
+        """Bulk result-store lookup: {index: raw stored result} for the hits."""
+        if self.mock_mode or self.store is None:
+            return {}
+        keys = {
+            i: self.store.make_key(item['text'], item.get('score'), PROMPT_VERSION)
+            for i, item in enumerate(reviews_data)
+            if not _is_blank(item['text'])
+        }
+        found = self.store.get_many(list(set(keys.values())))
+        return {i: dict(found[key]) for i, key in keys.items() if key in found}
+
+    # --- ASYNC ENGINE (one event loop, hundreds of requests in flight) ---
+
+    def _make_async_client(self, max_in_flight):
+        """
+        Fresh AsyncGroq per batch: its HTTP pool is bound to the running loop.
+        The pool holds one connection per in-flight slot: with the SDK's default
+        of 100, requests past it queued inside httpx and that wait counted
+        against their timeout (PoolTimeout, then a retry). Keep-alive stays at
+        the SDK's 20; larger idle pools make httpcore slower, not faster.
+        """
+        if self.async_client is not None:
+            return self.async_client, False
+        limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=20)
+        http_client = DefaultAsyncHttpxClient(limits=limits)
+        return AsyncGroq(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=http_client), True
+
+    async def _send_async(self, client, messages, max_completion_tokens, parse):
+        """Async twin of _send."""
+        estimate = self._estimate_tokens(messages, max_completion_tokens)
+        attempt = 0
+        started = time.monotonic()
+        try:
+            while True:
+                sent_at = None
+                try:
+                    self._check_deadline()
+                    await self.limiter.acquire_async(estimate)
+                    try:
+                        self._count_call()
+                        sent_at = time.monotonic()
+                        raw = await client.chat.completions.with_raw_response.create(
+                            messages=messages,
+                            model=MODEL_NAME,
+                            temperature=0.1,
+                            max_completion_tokens=max_completion_tokens,
+                            timeout=self.retry_policy.timeout
+                        )
+                        self.limiter.on_response(raw.headers)
+                        return self._parse_completion(parse, await raw.parse()), attempt
+                    finally:
+                        self.limiter.release()
+                except Exception as e:
+                    kind = self._on_error(e, attempt, sent_at)
+                await asyncio.sleep(self._backoff(kind, attempt))
+                attempt += 1
+        finally:
+            self._record_latency(started)
+
+    async def _call_llm_async(self, client, text, score):
+        return await self._send_async(client, self._build_messages(text, score), 512, self._parse_response)
+
+    async def _call_llm_packed_async(self, client, items):
+        return await self._send_async(
+            client, self._build_packed_messages(items), 100 + 80 * len(items),
+            lambda content: self._parse_packed_response(content, items),
+        )
+
+    async def analyze_review_async(self, client, text, score=None):
+        """Async twin of analyze_review (the result store is assumed already checked)."""
+        if self.mock_mode or _is_blank(text):
+            return self.analyze_review(text, score=score)
+
+        result = None
+        retries, error = 0, None
+        try:
+            result, retries = await self._call_llm_async(client, text, score)
+            if result and self.store is not None:
+                self.store.put(self.store.make_key(text, score, PROMPT_VERSION), result, PROMPT_VERSION, text=text, score=score)
+        except EnrichmentError as e:
+            retries, error = e.retries, e.kind
+
+        source = "llm"
+        if not result:
+            result = self._rule_based_analysis(text)
+            source = "rules"
+        return self._finalize(result, score, text, source, retries, error, PROMPT_VERSION if source == "llm" else None)
+
+    async def analyze_pack_async(self, client, reviews_data, retries=1):
+        """Async twin of analyze_pack."""
+        results, raw, keys, cached = self._pack_prepare(reviews_data)
+        tries, spent = {}, 0
+
+        for round_no in range(retries + 1):
+            pending = [i for i in raw if results[i] is None]
+            if not pending:
+                break
+            try:
+                parsed, call_retries = await self._call_llm_packed_async(client, [(i, reviews_data[i]['text'], reviews_data[i].get('score')) for i in pending])
+            except EnrichmentError as e:
+                parsed, call_retries = {}, e.retries
+            spent += call_retries + (1 if round_no else 0)
+            self._pack_absorb(reviews_data, results, keys, parsed, tries, spent)
+
+        for i in [i for i in raw if results[i] is None]:
+            raw.discard(i)
+            results[i] = await self.analyze_review_async(client, reviews_data[i]['text'], score=reviews_data[i].get('score'))
+        return self._pack_finish(reviews_data, results, raw, cached, tries)
+
+    async def _run_batch_async(self, reviews_data, max_in_flight, pack_size, emit):
+        """
+        Schedules every review (or pack) on the running loop, never more than
+        `max_in_flight` requests at once, and calls emit(index, result) as each completes.
+        A runner that raises (e.g. the result store failing) cancels the rest and
+        the exception propagates, so the consumer fails instead of waiting for
+        an index that will never arrive.
+        """
+        client, owned = self._make_async_client(max_in_flight)
+        window = asyncio.Semaphore(max_in_flight)
+        tasks = set()
+        failures = []
+
+        def reap(task):
+            tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                failures.append(task.exception())
+                for other in tasks:
+                    other.cancel()
+
+        async def run_single(i, item):
+            try:
+                emit(i, await self.analyze_review_async(client, item['text'], score=item.get('score')))
+            finally:
+                window.release()
+
+        async def run_pack(start, pack):
+            try:
+                for offset, result in enumerate(await self.analyze_pack_async(client, pack)):
+                    emit(start + offset, result)
+            finally:
+                window.release()
+
+        try:
+            if pack_size > 1:
+                units = [(run_pack, start, reviews_data[start:start + pack_size]) for start in range(0, len(reviews_data), pack_size)]
+            else:
+                cached = self._store_lookup(reviews_data)
+                for i, raw in cached.items():
+                    emit(i, self._from_store(raw, reviews_data[i]))
+                units = [(run_single, i, item) for i, item in enumerate(reviews_data) if i not in cached]
+
+            for runner, index, payload in units:
+                await window.acquire() # Bounded window: at most max_in_flight outstanding
+                if failures:
+                    break
+                task = asyncio.create_task(runner(index, payload))
+                tasks.add(task)
+                task.add_done_callback(reap) # Retrieves the exception of a failed runner
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if failures:
+                raise failures[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+            if owned:
+                await client.close()
+
+    def analyze_batch_async(self, reviews_data, max_in_flight=ASYNC_MAX_IN_FLIGHT, pack_size=1, deadline=None, threshold=None, dedup=None):
+        """
+        Same contract as analyze_batch_with_progress (a generator yielding results
+        in input order) but driven by asyncio on a single background thread, so
+        concurrency is bounded by `max_in_flight`, not by a thread pool.
+        """
+        yield from self._in_order(
+            self.analyze_batch_async_as_completed(reviews_data, max_in_flight, pack_size, deadline, threshold, dedup), len(reviews_data)
+        )
+
+    def analyze_batch_async_as_completed(self, reviews_data, max_in_flight=ASYNC_MAX_IN_FLIGHT, pack_size=1, deadline=None, threshold=None, dedup=None):
+        """Async engine, (index, result) pairs in completion order."""
+        self.deadline = time.monotonic() + deadline if deadline else None
+        self.cancelled = False
+        yield from self._staged(
+            reviews_data, threshold, dedup, lambda items: self._async_as_completed(items, max_in_flight, pack_size)
+        )
+
+    def _async_as_completed(self, reviews_data, max_in_flight, pack_size):
+        if self.mock_mode:
+            for i, item in enumerate(reviews_data):
+                yield i, self.analyze_review(item['text'], score=item.get('score'))
+            return
+
+        done = queue.Queue()
+        worker = threading.Thread(
+            target=self._drive_batch_async,
+            args=(reviews_data, max_in_flight, pack_size, done),
+            daemon=True,
+        )
+        worker.start()
+
+        for _ in range(len(reviews_data)):
+            index, result = done.get()
+            if index is None:
+                raise result
+            yield index, result
+        worker.join()
+
+    def _drive_batch_async(self, reviews_data, max_in_flight, pack_size, done):
+        try:
+            asyncio.run(self._run_batch_async(
+                reviews_data, max_in_flight, pack_size,
+                lambda i, result: done.put((i, result)),
+            ))
+        except BaseException as e:
+            done.put((None, e))
+
 
 if __name__ == "__main__":
     analyzer = ReviewAnalyzer()
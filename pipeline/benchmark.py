@@ -0,0 +1,279 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import itertools
+import subprocess
+import tempfile
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+try:
+    from pipeline.cache import CACHE_DIR
+    from pipeline.ai_enricher import ReviewAnalyzer, ASYNC_MAX_IN_FLIGHT, _is_blank
+    from pipeline.result_store import EnrichmentStore
+    from pipeline.stub_llm import StubConfig
+except ImportError:  # Executed as a script (python pipeline/benchmark.py)
+    from cache import CACHE_DIR
+    from ai_enricher import ReviewAnalyzer, ASYNC_MAX_IN_FLIGHT, _is_blank
+    from result_store import EnrichmentStore
+    from stub_llm import StubConfig
+
+REVIEWS_PATH = os.path.join("data", "olist_order_reviews_dataset.csv")
+STUB_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_llm.py")
+
+# Parameters that identify a run (compare mode matches runs on these)
+CASE_KEYS = ("engine", "batch_size", "workers", "pack_size", "cache_ratio")
+
+# Compare mode: metric -> direction ("higher" is better / "lower" is better)
+WATCHED_METRICS = {
+    "items_per_sec": "higher",
+    "p50_ms": "lower",
+    "p95_ms": "lower",
+    "p99_ms": "lower",
+    "api_calls": "lower",
+    "fallback_rate": "lower",
+}
+FALLBACK_SLACK = 0.01  # Absolute fallback-rate increase tolerated (rates near 0 make ratios meaningless)
+
+
+def load_corpus(path=REVIEWS_PATH, limit=None):
+    """Distinct non-blank (text, score) pairs, so a cache-hit ratio means what it says."""
+    reviews = pd.read_csv(path, usecols=["review_comment_message", "review_score"])
+    reviews = reviews.dropna().drop_duplicates()
+    items = [
+        {"text": text, "score": score}
+        for text, score in zip(reviews["review_comment_message"], reviews["review_score"])
+        if not _is_blank(text)
+    ]
+    return items[:limit] if limit else items
+
+
+class StubProcess:
+    """
+    The stub LLM in its own process: in-process, its handler threads would share
+    the GIL with the client under test and cap throughput at the stub's CPU.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        config = self.config
+        args = [
+            sys.executable, STUB_SCRIPT, "--port", "0",
+            "--latency-ms", str(config.latency_ms), "--latency-sigma", str(config.latency_sigma),
+            "--per-item-ms", str(config.per_item_ms), "--error-rate", str(config.error_rate),
+            "--throttle-rate", str(config.throttle_rate), "--malformed-rate", str(config.malformed_rate),
+        ]
+        if config.rpm:
+            args += ["--rpm", str(config.rpm)]
+        if config.seed is not None:
+            args += ["--seed", str(config.seed)]
+        self.process = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+        for line in self.process.stdout:
+            match = re.search(r"listening on (http://\S+)", line)
+            if match:
+                self.url = match.group(1)
+                break
+        if self.url is None:
+            self.process.kill()
+            raise RuntimeError("Stub LLM did not start")
+        return self
+
+    @property
+    def stats(self):
+        with urllib.request.urlopen(f"{self.url}/stats", timeout=5) as response:
+            return json.load(response)
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+def _percentiles(latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000}
+
+
+def run_case(items, base_url, engine="async", workers=ASYNC_MAX_IN_FLIGHT, pack_size=1, cache_ratio=0.0, store_dir=None):
+    """
+    One measured batch on a fresh ReviewAnalyzer (fresh limiter and counters).
+    The first `cache_ratio` share of the batch is warmed into a private store
+    beforehand, so exactly that share is served as cache hits.
+    Latency percentiles are per request, submit -> complete (retries and
+    limiter waits included; see ReviewAnalyzer._record_latency), so cache hits
+    and rule-routed items do not dilute them.
+    """
+    store = EnrichmentStore(os.path.join(store_dir, f"bench-{time.monotonic_ns()}.sqlite"))
+    warm = int(len(items) * cache_ratio)
+    if warm:
+        warmer = ReviewAnalyzer(store=store, base_url=base_url)
+        for _ in warmer.analyze_batch_async_as_completed(items[:warm], pack_size=pack_size):
+            pass
+
+    analyzer = ReviewAnalyzer(store=store, base_url=base_url)
+    if engine == "async":
+        batch = analyzer.analyze_batch_async_as_completed(items, max_in_flight=workers, pack_size=pack_size)
+    else:
+        batch = analyzer.analyze_batch_as_completed(items, max_workers=workers, pack_size=pack_size)
+
+    start = time.perf_counter()
+    for _ in batch:
+        pass
+    wall = time.perf_counter() - start
+    latencies = list(analyzer.request_latencies)
+
+    return {
+        "engine": engine,
+        "batch_size": len(items),
+        "workers": workers,
+        "pack_size": pack_size,
+        "cache_ratio": cache_ratio,
+        "wall_s": wall,
+        "items_per_sec": len(items) / wall if wall else 0.0,
+        **_percentiles(latencies),
+        "api_calls": analyzer.api_calls,
+        "fallback_rate": analyzer.fallback_rate(),
+        "throttled": analyzer.limiter.throttled,
+        "outcomes": dict(analyzer.outcomes),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def sweep(corpus, config, engines, batch_sizes, workers, pack_sizes, cache_ratios, repeats=1):
+    """Every combination against one stub server process; returns the JSON-ready report."""
+    runs = []
+    store_dir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        with StubProcess(config) as server:
+            for engine, size, n_workers, pack, ratio in itertools.product(
+                engines, batch_sizes, workers, pack_sizes, cache_ratios
+            ):
+                for repeat in range(repeats):
+                    result = run_case(corpus[:size], server.url, engine, n_workers, pack, ratio, store_dir)
+                    result["repeat"] = repeat
+                    runs.append(result)
+                    print(
+                        f"{engine:>6} n={size:<6} workers={n_workers:<4} pack={pack:<3} cache={ratio:.0%} | "
+                        f"{result['items_per_sec']:8.1f} items/s | p50 {result['p50_ms']:7.0f} ms | "
+                        f"p95 {result['p95_ms']:7.0f} ms | p99 {result['p99_ms']:7.0f} ms | "
+                        f"calls {result['api_calls']:5} | fallback {result['fallback_rate']:.1%}"
+                    )
+            stub_stats = server.stats
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "stub": vars(config),
+            "stub_stats": stub_stats,
+        },
+        "runs": runs,
+    }
+
+
+def _case_key(run):
+    return tuple(run[k] for k in CASE_KEYS)
+
+
+def _medians(runs):
+    """Median of each watched metric per case (repeats collapse into one row)."""
+    grouped = {}
+    for run in runs:
+        grouped.setdefault(_case_key(run), []).append(run)
+    return {
+        key: {metric: float(np.median([r[metric] for r in group])) for metric in WATCHED_METRICS}
+        for key, group in grouped.items()
+    }
+
+
+def compare(baseline, candidate, tolerance=0.10):
+    """
+    Returns the regressions of `candidate` vs `baseline` (both sweep reports):
+    a metric is flagged when it worsens by more than `tolerance` (relative),
+    or, for fallback_rate, by more than FALLBACK_SLACK (absolute).
+    """
+    base, cand = _medians(baseline["runs"]), _medians(candidate["runs"])
+    regressions = []
+    for key in sorted(base.keys() & cand.keys()):
+        for metric, better in WATCHED_METRICS.items():
+            old, new = base[key][metric], cand[key][metric]
+            if metric == "fallback_rate":
+                worse = new - old > FALLBACK_SLACK
+            elif better == "higher":
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance) and new - old > 1e-9
+            if worse:
+                regressions.append({"case": dict(zip(CASE_KEYS, key)), "metric": metric, "baseline": old, "candidate": new})
+    return regressions
+
+
+def _csv(kind):
+    return lambda value: [kind(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ReviewAnalyzer benchmark against the local stub LLM")
+    parser.add_argument("--engines", type=_csv(str), default=["async"], help="async,threads")
+    parser.add_argument("--batch-sizes", type=_csv(int), default=[200, 1000])
+    parser.add_argument("--workers", type=_csv(int), default=[8, 64], help="max_in_flight (async) / max_workers (threads)")
+    parser.add_argument("--pack-sizes", type=_csv(int), default=[1, 15])
+    parser.add_argument("--cache-ratios", type=_csv(float), default=[0.0, 0.5])
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--per-item-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=os.path.join(CACHE_DIR, "benchmark.json"))
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare two result files")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative slack before flagging a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            candidate = json.load(f)
+        regressions = compare(baseline, candidate, args.tolerance)
+        for r in regressions:
+            case = " ".join(f"{k}={v}" for k, v in r["case"].items())
+            print(f"REGRESSION {case} | {r['metric']}: {r['baseline']:.3f} -> {r['candidate']:.3f}")
+        print(f"{len(regressions)} regression(s) (tolerance {args.tolerance:.0%})")
+        sys.exit(1 if regressions else 0)
+
+    config = StubConfig(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, per_item_ms=args.per_item_ms,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, malformed_rate=args.malformed_rate,
+        rpm=args.rpm, seed=args.seed,
+    )
+    corpus = load_corpus(limit=max(args.batch_sizes))
+    report = sweep(corpus, config, args.engines, args.batch_sizes, args.workers, args.pack_sizes, args.cache_ratios, args.repeats)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results -> {args.out}")
@@ -0,0 +1,208 @@
+import os
+import json
+import hashlib
+import shutil
+import uuid
+
+import pandas as pd
+
+CACHE_DIR = os.path.join("data", ".cache")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Streaming SHA-256 of a file on disk."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_parquet(path):
+    """Reads a Parquet file, keeping string[pyarrow] columns Arrow-backed."""
+    with pd.option_context("mode.string_storage", "pyarrow"):
+        return pd.read_parquet(path, engine="pyarrow")
+
+
+def _atomic_write(path, writer):
+    """Writes through a temp file + rename so readers never see partial files."""
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        writer(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class SnapshotStore:
+    """
+    Columnar (Parquet) snapshots of parsed source files.
+    Each snapshot is keyed by the source file's size, mtime and content hash,
+    so a later load can skip CSV and datetime parsing entirely.
+    """
+
+    # Bump when the shape of the stored frames changes (dtypes, parsing rules...)
+    VERSION = 2
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(CACHE_DIR, "snapshots")
+
+    def _paths(self, key):
+        return (
+            os.path.join(self.root, f"{key}.parquet"),
+            os.path.join(self.root, f"{key}.json"),
+        )
+
+    def _read_manifest(self, key):
+        _, manifest_path = self._paths(key)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, key, manifest):
+        _, manifest_path = self._paths(key)
+
+        def writer(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+        _atomic_write(manifest_path, writer)
+
+    def load(self, key, source_path):
+        """Returns the snapshot for `source_path` or None if missing/stale."""
+        manifest = self._read_manifest(key)
+        data_path, _ = self._paths(key)
+        if not manifest or manifest.get("version") != self.VERSION or not os.path.exists(data_path):
+            return None
+
+        stat = os.stat(source_path)
+        if stat.st_size != manifest.get("size"):
+            return None
+
+        # Cheap path: same size and mtime. Otherwise confirm with the content hash
+        # (a `touch` or a fresh checkout must not invalidate the snapshot).
+        if stat.st_mtime_ns != manifest.get("mtime_ns"):
+            if file_digest(source_path) != manifest.get("sha256"):
+                return None
+            manifest["mtime_ns"] = stat.st_mtime_ns
+            self._write_manifest(key, manifest)
+
+        return _read_parquet(data_path)
+
+    def save(self, key, source_path, df):
+        """Stores `df` as the snapshot of `source_path`."""
+        os.makedirs(self.root, exist_ok=True)
+        stat = os.stat(source_path)
+        data_path, _ = self._paths(key)
+
+        _atomic_write(data_path, lambda tmp: df.to_parquet(tmp, engine="pyarrow", index=False))
+        self._write_manifest(key, {
+            "version": self.VERSION,
+            "source": os.path.basename(source_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_digest(source_path),
+            "rows": len(df),
+        })
+
+
+def stream_digest(buffers, chunk_size=1 << 20):
+    """
+    Streaming SHA-256 over a dict of file-like objects (e.g. Streamlit uploads).
+    Keys and file extensions are part of the digest (the extension picks the
+    parser), file names are not: a renamed upload is the same dataset.
+    Read positions are restored.
+    """
+    h = hashlib.sha256()
+    for key in sorted(buffers):
+        buf = buffers[key]
+        extension = os.path.splitext(getattr(buf, 'name', ''))[1].lower()
+        h.update(f"{key}:{extension}\0".encode("utf-8"))
+        pos = buf.tell()
+        buf.seek(0)
+        for block in iter(lambda: buf.read(chunk_size), b""):
+            h.update(block)
+        buf.seek(pos)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Disk LRU of processed DataFrames, shared across sessions, processes and restarts.
+    Entries are directories of Parquet files; recency is tracked through the
+    entry's manifest mtime and the oldest entries are evicted past `max_bytes`.
+    """
+
+    # Bump when the pipeline output changes so stale entries are never served
+    VERSION = 6
+
+    def __init__(self, root=None, max_bytes=2 * 1024 ** 3):
+        self.root = root or os.path.join(CACHE_DIR, "artifacts")
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.root, f"v{self.VERSION}-{key}")
+
+    def get(self, key):
+        """Returns the dict of frames stored under `key`, or None."""
+        entry = self._entry(key)
+        manifest_path = os.path.join(entry, "manifest.json")
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            frames = {
+                name: _read_parquet(os.path.join(entry, f"{name}.parquet")) if stored else None
+                for name, stored in manifest["frames"].items()
+            }
+            os.utime(manifest_path)  # LRU touch
+        except (OSError, ValueError, KeyError):
+            # Missing, half-evicted or corrupt entry: treat as a miss
+            return None
+        return frames
+
+    def put(self, key, frames):
+        """Stores a dict of frames (None values allowed) under `key`."""
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{entry}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            for name, df in frames.items():
+                if df is not None:
+                    df.to_parquet(os.path.join(tmp, f"{name}.parquet"), engine="pyarrow")
+            with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump({"frames": {name: df is not None for name, df in frames.items()}}, f)
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process published the same entry first
+            pass
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        self._evict()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            manifest_path = os.path.join(path, "manifest.json")
+            if name.endswith(".tmp") or not os.path.exists(manifest_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(manifest_path), size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -1,130 +1,526 @@
 import pandas as pd
 import numpy as np
 import os
+import csv
+import codecs
 import glob
+import concurrent.futures
 from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+try:
+    from pipeline.cache import SnapshotStore
+except ImportError:  # Executed as a script (python pipeline/data_processor.py)
+    from cache import SnapshotStore
+
+ORDER_DATE_COLUMNS = ['order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date', 'order_delivered_customer_date', 'order_estimated_delivery_date']
+
+# --- SCHEMA REGISTRY ---
+# Declared column types for the Olist tables. The column list doubles as `usecols`
+# for local reads; uploads keep extra columns but get the declared casts.
+#   id        -> string[pyarrow] (compact, hashed fast in merges/groupbys)
+#   text      -> object (free text; missing values stay NaN for .str filters)
+#   category  -> pandas category
+#   timestamp -> datetime64[ns], parsed with TIMESTAMP_FORMATS
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', pa_csv.ISO8601]
+
+TABLE_SCHEMAS = {
+    "orders": {
+        "columns": {
+            "order_id": "id",
+            "customer_id": "id",
+            "order_status": "category",
+            "order_purchase_timestamp": "timestamp",
+            "order_approved_at": "timestamp",
+            "order_delivered_carrier_date": "timestamp",
+            "order_delivered_customer_date": "timestamp",
+            "order_estimated_delivery_date": "timestamp",
+        },
+        "multiline": False,
+    },
+    "payments": {
+        "columns": {
+            "order_id": "id",
+            "payment_sequential": "int16",
+            "payment_type": "category",
+            "payment_installments": "int16",
+            "payment_value": "float64", # Money: never downcast to float32
+        },
+        "multiline": False,
+    },
+    "reviews": {
+        "columns": {
+            "review_id": "id",
+            "order_id": "id",
+            "review_score": "int8",
+            "review_comment_title": "text",
+            "review_comment_message": "text",
+            "review_creation_date": "timestamp",
+        },
+        "multiline": True, # Comments contain quoted line breaks
+    },
+}
+
+# Candidate formats tried (on a sample) when a timestamp column arrives as text
+TIMESTAMP_CANDIDATES = [
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y',
+]
+
+SNIFF_BYTES = 64 * 1024 # Bounded prefix used to detect encoding/dialect
+
+class IngestReport(NamedTuple):
+    """What the ingestor detected and did for one file."""
+    filename: str
+    format: str
+    encoding: Optional[str] = None
+    delimiter: Optional[str] = None
+    quotechar: Optional[str] = None
+    has_header: Optional[bool] = None
+    rows: int = 0
+    columns: int = 0
+    reparsed: bool = False # True if the detected encoding failed past the sniffed prefix
+    message: Optional[str] = None # What was assumed or why the file was rejected
+
+# Text columns are read as large_string so the types_mapper below only turns
+# `id` columns (plain string) into string[pyarrow].
+_ARROW_TYPES = {
+    "id": pa.string(),
+    "text": pa.large_string(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "timestamp": pa.timestamp("ns"),
+    "int8": pa.int8(),
+    "int16": pa.int16(),
+    "float64": pa.float64(),
+}
 
 class DataIngestor:
-    def __init__(self, data_dir="data"):
+    LOCAL_FILES = {
+        "orders": "olist_orders_dataset.csv",
+        "payments": "olist_order_payments_dataset.csv",
+        "reviews": "olist_order_reviews_dataset.csv"
+    }
+
+    def __init__(self, data_dir="data", use_snapshots=True, max_workers=3):
         self.data_dir = data_dir
+        self.max_workers = max_workers # Concurrent dataset loads
+        self.load_errors = {} # key -> exception from the last load_data
+        self.snapshots = SnapshotStore(os.path.join(data_dir, ".cache", "snapshots")) if use_snapshots else None
+        self.source = None # "upload" or "local" after a successful load_data
+        self.ingest_reports = {} # key -> IngestReport for uploaded files
 
 
-    def _optimize_memory(self, df):
-        """Downcasts types to reduce memory usage."""
+    def _optimize_memory(self, df, skip=()):
+        """Downcasts types to reduce memory usage. Columns in `skip` (declared schema) are left alone."""
         if df is None: return None
         
         # Downcast Numbers
-        for col in df.select_dtypes(include=['float']):
+        for col in df.select_dtypes(include=['float']).columns.difference(skip):
             df[col] = pd.to_numeric(df[col], downcast='float')
-        for col in df.select_dtypes(include=['int']):
+        for col in df.select_dtypes(include=['int']).columns.difference(skip):
             df[col] = pd.to_numeric(df[col], downcast='integer')
             
         # Convert low-cardinality objects to category
-        for col in df.select_dtypes(include=['object']):
-            if df[col].nunique() / len(df) < 0.5: # If < 50% unique
+        for col in df.select_dtypes(include=['object']).columns.difference(skip):
+            if df[col].nunique() / max(1, len(df)) < 0.5: # If < 50% unique
                 df[col] = df[col].astype('category')
                 
         return df
 
-    def _read_enhanced(self, file, filename):
+    def _read_with_schema(self, key, path):
+        """Multithreaded Arrow CSV read with the declared schema (types, usecols, timestamp formats)."""
+        schema = TABLE_SCHEMAS[key]
+        with open(path, newline='', encoding='utf-8') as f:
+            header = next(csv.reader(f), [])
+        columns = [c for c in schema["columns"] if c in header]
+
+        table = pa_csv.read_csv(
+            path,
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=schema["multiline"]),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns,
+                column_types={c: _ARROW_TYPES[schema["columns"][c]] for c in columns},
+                timestamp_parsers=TIMESTAMP_FORMATS,
+                strings_can_be_null=True,
+            ),
+        )
+        return table.to_pandas(types_mapper=lambda t: pd.StringDtype("pyarrow") if t == pa.string() else None)
+
+    def _apply_schema(self, key, df):
+        """Casts the declared columns of an already-loaded frame (uploads, fallback reads)."""
+        for col, kind in TABLE_SCHEMAS[key]["columns"].items():
+            if col not in df.columns:
+                continue
+            try:
+                if kind == "id":
+                    df[col] = df[col].astype("string[pyarrow]")
+                elif kind == "text":
+                    df[col] = df[col].astype(object)
+                elif kind == "category":
+                    df[col] = df[col].astype("category")
+                elif kind == "timestamp":
+                    pass # Parsed by DataCleaner.clean_orders
+                else:
+                    values = pd.to_numeric(df[col], errors='coerce')
+                    # Integer types only when nothing is missing, otherwise keep float (NaN-safe filters)
+                    df[col] = values.astype(kind) if kind == "float64" or not values.isna().any() else values
+            except (ValueError, TypeError) as e:
+                print(f"Schema cast skipped for {key}.{col}: {e}")
+        return df
+
+    def _sniff_csv(self, file, key=None):
+        """Detects encoding, delimiter, quote char and header from a bounded prefix."""
+        file.seek(0)
+        head = file.read(SNIFF_BYTES)
+        file.seek(0)
+        if isinstance(head, str):
+            head = head.encode('utf-8')
+
+        # 1. Encoding: BOM, then strict UTF-8 (tolerating a char cut at the boundary), else latin1
+        if head.startswith(codecs.BOM_UTF8):
+            encoding = 'utf-8-sig'
+        else:
+            try:
+                head.decode('utf-8')
+                encoding = 'utf-8'
+            except UnicodeDecodeError as e:
+                truncated = len(head) == SNIFF_BYTES and e.start >= len(head) - 3
+                encoding = 'utf-8' if truncated and e.reason == 'unexpected end of data' else 'latin1'
+
+        text = head.decode(encoding, errors='ignore')
+        sample = text[:text.rfind('\n')] if '\n' in text else text
+
+        # 2. Dialect
+        sniffer = csv.Sniffer()
+        try:
+            dialect = sniffer.sniff(sample, delimiters=',;\t|')
+            delimiter, quotechar = dialect.delimiter, dialect.quotechar or '"'
+        except csv.Error:
+            first_line = sample.split('\n', 1)[0]
+            delimiter, quotechar = max(',;\t|', key=first_line.count), '"'
+
+        # 3. Header: known schema columns in the first row win over the heuristic
+        first_row = next(csv.reader([sample.split('\n', 1)[0]], delimiter=delimiter, quotechar=quotechar), [])
+        known = set(TABLE_SCHEMAS.get(key, {}).get("columns", {}))
+        normalized = {c.strip().lower().replace(' ', '_') for c in first_row}
+        if known & normalized:
+            has_header = True
+        else:
+            try:
+                has_header = sniffer.has_header(sample)
+            except csv.Error:
+                has_header = True
+
+        return encoding, delimiter, quotechar, has_header
+
+    def _read_enhanced(self, file, filename, key=None):
         """Enhanced loader that handles multiple formats and encoding logic."""
         if filename.endswith('.xlsx') or filename.endswith('.xls'):
-            return pd.read_excel(file, engine='openpyxl')
+            df = pd.read_excel(file, engine='openpyxl')
+            self.ingest_reports[key or filename] = IngestReport(filename, 'excel', rows=len(df), columns=df.shape[1])
+            return df
             
         elif filename.endswith('.parquet'):
-            return pd.read_parquet(file, engine='pyarrow')
+            df = pd.read_parquet(file, engine='pyarrow')
+            self.ingest_reports[key or filename] = IngestReport(filename, 'parquet', rows=len(df), columns=df.shape[1])
+            return df
             
         elif filename.endswith('.json'):
             try:
-                return pd.read_json(file, orient='records')
-            except:
+                df = pd.read_json(file, orient='records')
+            except ValueError:
                 file.seek(0)
-                return pd.read_json(file)
+                df = pd.read_json(file, lines=True) # JSON-lines export
+            self.ingest_reports[key or filename] = IngestReport(filename, 'json', rows=len(df), columns=df.shape[1])
+            return df
                 
-        else: # Default to CSV
+        else: # Default to CSV: sniff once, parse once
+            encoding, delimiter, quotechar, has_header = self._sniff_csv(file, key)
+            read_args = dict(sep=delimiter, quotechar=quotechar, header=0 if has_header else None, low_memory=False)
+            reparsed = False
             try:
-                return pd.read_csv(file, low_memory=False, encoding='utf-8')
+                df = pd.read_csv(file, encoding=encoding, **read_args)
             except UnicodeDecodeError:
+                # Prefix was valid UTF-8 but the body is not: one latin1 re-parse (reported)
                 file.seek(0)
-                return pd.read_csv(file, low_memory=False, encoding='latin1')
-            except Exception:
-                file.seek(0)
-                return pd.read_csv(file, low_memory=False, sep=';', encoding='latin1') # Euro CSV fallback
+                encoding, reparsed = 'latin1', True
+                df = pd.read_csv(file, encoding=encoding, **read_args)
+
+            message, rejected = None, False
+            if not has_header:
+                # header=None labels columns 0..n-1: only positional schema names can stand in
+                expected = list(TABLE_SCHEMAS[key]["columns"]) if key in TABLE_SCHEMAS else None
+                if expected and df.shape[1] == len(expected):
+                    df.columns = expected
+                    message = f"no header row: assigned the {key} schema column names"
+                else:
+                    rejected = True
+                    message = (f"no header row and {df.shape[1]} columns"
+                               + (f" (the {key} schema has {len(expected)})" if expected else "")
+                               + ": add a header row with the column names")
+
+            report = IngestReport(filename, 'csv', encoding, delimiter, quotechar, has_header, len(df), df.shape[1], reparsed, message)
+            self.ingest_reports[key or filename] = report
+            print(f"Ingest report: {report}")
+            if rejected:
+                raise ValueError(f"{filename}: {message}")
+            return df
+
+    def _read_local(self, key, path):
+        """Reads a local CSV, served from the Parquet snapshot when the file is unchanged."""
+        if self.snapshots:
+            try:
+                df = self.snapshots.load(key, path)
+                if df is not None:
+                    print(f"Loaded {key} from snapshot")
+                    return df
+            except Exception as e:
+                print(f"Snapshot read failed for {key}: {e}")
+
+        try:
+            df = self._read_with_schema(key, path)
+        except (pa.ArrowInvalid, UnicodeDecodeError) as e:
+            # Off-schema file (unexpected formats/encoding): generic parse, then cast
+            print(f"Schema read failed for {key}, using generic parser: {e}")
+            df = self._apply_schema(key, pd.read_csv(path, low_memory=False))
+            if key == "orders":
+                # Parse timestamps here so the snapshot stores them typed
+                for col in ORDER_DATE_COLUMNS:
+                    if col in df.columns:
+                        df[col] = pd.to_datetime(df[col], errors='coerce')
+        df = self._optimize_memory(df, skip=list(TABLE_SCHEMAS[key]["columns"]))
+
+        if self.snapshots:
+            try:
+                self.snapshots.save(key, path, df)
+            except Exception as e:
+                print(f"Snapshot write failed for {key}: {e}")
+        return df
+
+    def _load_upload(self, key, file):
+        """Reads, normalizes and optimizes one uploaded dataset."""
+        filename = file.name.lower()
+        print(f"Loading uploaded {key}: {filename}")
+        df = self._read_enhanced(file, filename, key)
+        if df is None:
+            return None
+        df.columns = df.columns.astype(str).str.strip().str.lower().str.replace(' ', '_')
+        df = self._apply_schema(key, df)
+        return self._optimize_memory(df, skip=list(TABLE_SCHEMAS[key]["columns"]))
+
+    def _load_parallel(self, jobs):
+        """
+        Runs {key: (fn, arg)} loads concurrently (parsing releases the GIL).
+        Returns loaded frames; failures are recorded per dataset in self.load_errors.
+        """
+        data = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(jobs)))) as executor:
+            futures = {executor.submit(fn, key, arg): key for key, (fn, arg) in jobs.items()}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    df = future.result()
+                except Exception as e:
+                    self.load_errors[key] = e
+                    print(f"Error loading {key}: {e}")
+                    continue
+                if df is not None:
+                    data[key] = df
+                    print(f"Loaded {key}: {len(df)} rows")
+        return data
 
     def load_data(self, uploaded_files=None):
         """Loads data from CSV files in the data directory OR from uploaded file buffers."""
         required_keys = ["orders", "payments", "reviews"]
-        data = {}
+        self.load_errors = {}
 
         # 1. Handle Uploaded Files (Priority)
         if uploaded_files:
             print("Loading from uploaded files...")
-            try:
-                for key in required_keys:
-                    if key in uploaded_files and uploaded_files[key] is not None:
-                        file = uploaded_files[key]
-                        filename = file.name.lower()
-                        print(f"Loading uploaded {key}: {filename}")
-                        
-                        # Load Data
-                        df = self._read_enhanced(file, filename)
-                        
-                        # Normalize & Optimize
-                        if df is not None:
-                            df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-                            data[key] = self._optimize_memory(df)
-                            
-                        print(f"Loaded uploaded {key}: {len(data[key])} rows")
-                
-                if len(data) == 3:
-                    return data
-                else:
-                    print("Incomplete uploaded files. Falling back to local data...")
-            except Exception as e:
-                print(f"Error reading uploaded files: {e}")
-
+            jobs = {
+                key: (self._load_upload, uploaded_files[key])
+                for key in required_keys
+                if uploaded_files.get(key) is not None
+            }
+            data = self._load_parallel(jobs)
+            if len(data) == 3:
+                self.source = "upload"
+                return data
+            print("Incomplete uploaded files. Falling back to local data...")
 
         # 2. Fallback to Local Files (data/ folder)
-        required_files = {
-            "orders": "olist_orders_dataset.csv",
-            "payments": "olist_order_payments_dataset.csv",
-            "reviews": "olist_order_reviews_dataset.csv"
-        }
-        
-        missing_files = []
-
         if not os.path.exists(self.data_dir):
             print(f"Data directory '{self.data_dir}' not found.")
             return None
 
-        for key, filename in required_files.items():
-            path = os.path.join(self.data_dir, filename)
-            if os.path.exists(path):
-                try:
-                    data[key] = pd.read_csv(path)
-                    print(f"Loaded {key}: {len(data[key])} rows")
-                except Exception as e:
-                    print(f"Error loading {filename}: {e}")
-                    missing_files.append(filename)
-            else:
-                missing_files.append(filename)
-        
+        paths = {key: os.path.join(self.data_dir, filename) for key, filename in self.LOCAL_FILES.items()}
+        missing_files = [self.LOCAL_FILES[key] for key, path in paths.items() if not os.path.exists(path)]
         if missing_files:
             print(f"Missing files: {missing_files}")
             return None
-            
+
+        data = self._load_parallel({key: (self._read_local, path) for key, path in paths.items()})
+        if len(data) < 3:
+            print(f"Failed datasets: {list(self.load_errors)}")
+            return None
+
+        self.source = "local"
         return data
 
+    def iter_chunks(self, key, source, chunksize=100_000):
+        """
+        Yields typed DataFrame chunks of at most `chunksize` rows from a CSV or
+        JSON-lines file (path or buffer), so memory never depends on file size.
+        """
+        name = (source if isinstance(source, str) else getattr(source, "name", "")).lower()
+        if name.endswith(('.json', '.jsonl', '.ndjson')):
+            reader = pd.read_json(source, lines=True, chunksize=chunksize)
+        else:
+            reader = pd.read_csv(source, chunksize=chunksize, low_memory=False)
+
+        with reader:
+            for chunk in reader:
+                chunk.columns = chunk.columns.str.strip().str.lower().str.replace(' ', '_')
+                yield self._apply_schema(key, chunk)
+
+    def stream_aggregates(self, sources=None, chunksize=100_000, review_sample_size=5000):
+        """
+        Streaming ingestion mode for exports larger than RAM.
+        `sources` maps orders/payments/reviews to paths or buffers (defaults to the
+        local files). Returns StreamingMetrics results instead of full frames.
+        """
+        if sources is None:
+            sources = {key: os.path.join(self.data_dir, filename) for key, filename in self.LOCAL_FILES.items()}
+
+        metrics = StreamingMetrics(review_sample_size=review_sample_size)
+        # Payments first: orders fold the per-order totals into customer/day aggregates
+        for chunk in self.iter_chunks("payments", sources["payments"], chunksize):
+            metrics.add_payments(chunk)
+        for chunk in self.iter_chunks("orders", sources["orders"], chunksize):
+            metrics.add_orders(chunk)
+        for chunk in self.iter_chunks("reviews", sources["reviews"], chunksize):
+            metrics.add_reviews(chunk)
+
+        return metrics.results()
+
+def key_column(df, entity):
+    """Join/group column for an entity ('order' or 'customer'): int surrogate if encoded, else the hex ID."""
+    return f"{entity}_key" if f"{entity}_key" in df.columns else f"{entity}_id"
+
+class IdDictionary:
+    """
+    Dense int32 surrogates for the 32-char hex Olist IDs.
+    Joins and groupbys run on the integer keys; the hex strings are only
+    looked up (decode) for display.
+    """
+
+    def __init__(self, vocab=None):
+        self.vocab = vocab or {} # id column -> pd.Index (position = surrogate key)
+
+    def fit_transform(self, name, *columns):
+        """Factorizes several ID columns jointly (one hash pass); returns int32 keys per column (-1 = missing)."""
+        codes, uniques = pd.factorize(pd.concat(columns, ignore_index=True))
+        self.vocab[name] = pd.Index(uniques, name=name)
+        splits = np.cumsum([len(c) for c in columns])[:-1]
+        return [part.astype(np.int32) for part in np.split(codes, splits)]
+
+    def decode(self, name, keys):
+        """Reverse lookup: int keys -> hex IDs (display only)."""
+        keys = np.asarray(keys, dtype=np.int64)
+        values = self.vocab[name].take(np.where(keys < 0, 0, keys)).to_numpy(dtype=object)
+        values[keys < 0] = None
+        return values
+
+    def to_frames(self):
+        """Serializable form (one single-column frame per vocabulary)."""
+        return {f"ids_{name}": index.to_frame(index=False) for name, index in self.vocab.items()}
+
+    @classmethod
+    def from_frames(cls, frames):
+        return cls({key[len("ids_"):]: pd.Index(df.iloc[:, 0], name=key[len("ids_"):]) for key, df in frames.items() if key.startswith("ids_")})
+
 class DataCleaner:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers # Parallel timestamp columns
+        self.timestamp_report = {} # column -> {"format", "coerced"} from the last parse
+
+    @staticmethod
+    def detect_timestamp_format(series, sample_size=500):
+        """Picks the candidate format that parses most of a strided sample (None if none fits)."""
+        step = max(1, len(series) // (sample_size * 4))
+        sample = series.iloc[::step].dropna().astype(str).drop_duplicates().head(sample_size)
+        if sample.empty:
+            return None
+        best, best_rate = None, 0.0
+        for fmt in TIMESTAMP_CANDIDATES:
+            rate = pd.to_datetime(sample, format=fmt, errors='coerce').notna().mean()
+            if rate > best_rate:
+                best, best_rate = fmt, rate
+            if rate == 1.0:
+                break
+        return best if best_rate >= 0.9 else None
+
+    @classmethod
+    def _parse_timestamp_column(cls, series):
+        """Parses one column with its detected format; returns (values, format, coerced-null count)."""
+        fmt = cls.detect_timestamp_format(series)
+        if fmt and fmt.startswith('%Y-%m-%d'):
+            # ISO-like: pandas' vectorized ISO parser beats any caching
+            result = pd.to_datetime(series, format=fmt, errors='coerce')
+        else:
+            # strptime-style formats are slow per value: parse each distinct value once
+            codes, uniques = pd.factorize(series)
+            parsed = pd.to_datetime(pd.Series(uniques, dtype=object).astype(str), format=fmt or 'mixed', errors='coerce')
+            values = parsed.to_numpy(dtype='datetime64[ns]')
+            values = values.take(np.where(codes < 0, 0, codes)) if len(values) else np.empty(len(codes), dtype='datetime64[ns]')
+            values[codes < 0] = np.datetime64('NaT')
+            result = pd.Series(values, index=series.index, name=series.name)
+        coerced = int(result.isna().sum() - series.isna().sum())
+        return result, fmt, coerced
+
+    def parse_timestamps(self, df, columns):
+        """Parses text timestamp columns in parallel; reports the format and coerced-null count per column."""
+        todo = [c for c in columns if c in df.columns and not pd.api.types.is_datetime64_any_dtype(df[c])]
+        if not todo:
+            return df
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(todo))) as executor:
+            parsed = dict(zip(todo, executor.map(lambda c: self._parse_timestamp_column(df[c]), todo)))
+        for col, (values, fmt, coerced) in parsed.items():
+            df[col] = values
+            self.timestamp_report[col] = {"format": fmt, "coerced": coerced}
+            if coerced:
+                print(f"Timestamp column {col}: {coerced} values coerced to NaT (format={fmt})")
+        return df
+
+    def encode_keys(self, orders, payments, reviews, ids):
+        """
+        Replaces order_id/customer_id with int32 surrogate keys (order_key/customer_key)
+        in all three tables. The vocabularies are stored in `ids` for display lookups.
+        """
+        order_keys = ids.fit_transform('order_id', orders['order_id'], payments['order_id'], reviews['order_id'])
+        (customer_keys,) = ids.fit_transform('customer_id', orders['customer_id'])
+
+        orders = orders.drop(columns=['order_id', 'customer_id'])
+        orders.insert(0, 'customer_key', customer_keys)
+        orders.insert(0, 'order_key', order_keys[0])
+
+        encoded = [orders]
+        for df, keys in ((payments, order_keys[1]), (reviews, order_keys[2])):
+            df = df.drop(columns=['order_id'])
+            df.insert(0, 'order_key', keys)
+            encoded.append(df)
+        return tuple(encoded)
+
     def clean_orders(self, df):
-        # Convert dates
-        date_cols = ['order_purchase_timestamp', 'order_approved_at', 'order_delivered_carrier_date', 'order_delivered_customer_date', 'order_estimated_delivery_date']
-        for col in date_cols:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
+        # Convert dates (already typed when served from a snapshot)
+        df = self.parse_timestamps(df, ORDER_DATE_COLUMNS)
         
         # Deduplicate
-        df = df.drop_duplicates("order_id")
+        df = df.drop_duplicates(key_column(df, "order"))
         return df
 
     def clean_reviews(self, df):
@@ -140,24 +536,80 @@ class DataCleaner:
             df['review_comment_title'] = df['review_comment_title'].fillna("")
         return df
 
-    def merge_datasets(self, orders, payments, reviews):
-        """Merges orders, payments, and reviews into a single DataFrame."""
+    def aggregate_payments(self, payments):
+        """
+        One row per order: total paid, number of payments, max installments,
+        dominant payment type and the type mix (e.g. "credit_card+voucher").
+        """
+        key = key_column(payments, "order")
+        grouped = payments.groupby(key, observed=True, sort=False)
+        agg = grouped['payment_value'].agg(['sum', 'size'])
+        agg.columns = ['payment_value', 'payment_count']
+
+        if 'payment_installments' in payments.columns:
+            agg['payment_installments'] = grouped['payment_installments'].max()
+
+        if 'payment_type' in payments.columns:
+            # Value per (order, type) -> dominant type + presence bitmask decoded to a label
+            by_type = payments.groupby([key, 'payment_type'], observed=True, sort=False)['payment_value'].sum().unstack(fill_value=0.0)
+            by_type = by_type.reindex(agg.index)
+            types = by_type.columns.astype(str)
+            agg['payment_type'] = pd.Categorical(types[by_type.to_numpy().argmax(axis=1)], categories=types)
+
+            bit ={t: 1 << i for i, t in enumerate(types)}
+            masks = (payments[[key, 'payment_type']].drop_duplicates()
+                     .assign(bit=lambda d: d['payment_type'].astype(str).map(bit))
+                     .groupby(key, observed=True, sort=False)['bit'].sum()
+                     .reindex(agg.index))
+            labels = {m: '+'.join(t for t in types if m & bit[t]) for m in masks.unique()}
+            agg['payment_mix'] = masks.map(labels).astype('category')
+
+        return agg.reset_index()
+
+    def aggregate_reviews(self, reviews):
+        """One row per order: the latest review (score, title, message) plus the review count."""
+        order_col = 'review_creation_date' if 'review_creation_date' in reviews.columns else None
+        key = key_column(reviews, "order")
+        ranked = reviews.sort_values(order_col, kind='stable') if order_col else reviews
+        latest = ranked.drop_duplicates(key, keep='last')
+        counts = reviews.groupby(key, observed=True, sort=False).size().rename('review_count')
+        return latest.merge(counts, left_on=key, right_index=True, how='left')
+
+    def merge_datasets(self, orders, payments, reviews, grain="order"):
+        """
+        Merges orders, payments, and reviews into a single DataFrame.
+        grain="order" pre-aggregates payments and reviews so the result keeps one
+        row per order (no installment x review fan-out); grain="review" keeps one
+        row per review with its order's status and purchase date (the CX views);
+        grain="raw" is the legacy row-multiplying join.
+        """
         if orders is None or payments is None or reviews is None:
             return pd.DataFrame()
+
+        if grain == "review":
+            key = key_column(reviews, "order")
+            order_fields = [c for c in (key, 'order_status', 'order_purchase_timestamp') if c in orders.columns]
+            return pd.merge(reviews, orders[order_fields], on=key, how="left")
+
+        if grain == "order":
+            payments = self.aggregate_payments(payments)
+            reviews = self.aggregate_reviews(reviews)
+
+        key = key_column(orders, "order") # int surrogate when encoded
             
         # Merge orders and payments
         # Use inner join for payments to ensure we have value, left join for reviews
-        df = pd.merge(orders, payments, on="order_id", how="left")
+        df = pd.merge(orders, payments, on=key, how="left")
         
         # Merge with reviews
-        df = pd.merge(df, reviews, on="order_id", how="left")
+        df = pd.merge(df, reviews, on=key, how="left")
         
         return df
 
     def normalize_columns(self, df):
         """Standardizes column names to snake_case and lowercase."""
         if df is None: return None
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+        df.columns = df.columns.astype(str).str.strip().str.lower().str.replace(' ', '_')
         return df
 
 class SchemaValidator:
@@ -196,11 +648,12 @@ class SchemaValidator:
 class MetricsEngine:
     def calculate_ltv(self, full_df):
         """Calculates LTV per customer."""
-        if 'payment_value' not in full_df or 'customer_id' not in full_df:
+        customer = key_column(full_df, "customer")
+        if 'payment_value' not in full_df or customer not in full_df:
             return pd.DataFrame()
         
-        ltv = full_df.groupby('customer_id')['payment_value'].sum().reset_index()
-        ltv.columns = ['customer_id', 'ltv']
+        ltv = full_df.groupby(customer, observed=True)['payment_value'].sum().reset_index()
+        ltv.columns = [customer, 'ltv']
         return ltv
 
     def calculate_churn_risk(self, orders_df):
@@ -214,7 +667,7 @@ class MetricsEngine:
         max_date = orders_df['order_purchase_timestamp'].max()
         
         # Latest purchase per customer
-        recency = orders_df.groupby('customer_id')['order_purchase_timestamp'].max().reset_index()
+        recency = orders_df.groupby(key_column(orders_df, "customer"), observed=True)['order_purchase_timestamp'].max().reset_index()
         recency['days_since_last_order'] = (max_date - recency['order_purchase_timestamp']).dt.days
         
         # Retail Logic: Active Customers (Last 30 days)
@@ -223,6 +676,115 @@ class MetricsEngine:
         
         return recency
 
+    ROLLUP_GRAINS = {
+        "day": lambda ts: ts.dt.normalize(),
+        "week": lambda ts: ts.dt.to_period('W').dt.start_time,
+        "month": lambda ts: ts.dt.to_period('M').dt.start_time,
+    }
+
+    def _rollup(self, df, keys):
+        """Revenue, order counts, distinct customers and status counts per group."""
+        grouped = df.groupby(keys, observed=True, sort=True)
+        cube = pd.DataFrame({
+            'revenue': grouped['payment_value'].sum(),
+            'orders': grouped.size(),
+            'paid_orders': grouped['payment_value'].count(),
+            'customers': grouped[key_column(df, "customer")].nunique(),
+        })
+        if 'order_status' in df.columns:
+            status = df.groupby(keys + ['order_status'], observed=True).size().unstack(fill_value=0)
+            status.columns = [f"status_{c}" for c in status.columns]
+            cube = cube.join(status)
+            cube[status.columns] = cube[status.columns].fillna(0).astype('int64')
+        return cube.reset_index()
+
+    def build_rollup(self, full_df, churn_df=None):
+        """
+        Compact time rollup cube, built once per dataset version.
+        Returns {"all": 1 row, "day"/"week"/"month": one row per period}, so
+        renders cost O(periods) instead of O(rows).
+        """
+        if 'order_purchase_timestamp' not in full_df or 'payment_value' not in full_df:
+            return {}
+
+        ts = full_df['order_purchase_timestamp']
+        cube = {"all": self._rollup(full_df.assign(period=0), ['period']).drop(columns='period')}
+        if churn_df is not None and 'is_active_30d' in churn_df:
+            cube["all"]['active_customers_30d'] = int(churn_df['is_active_30d'].sum())
+
+        for grain, bucket in self.ROLLUP_GRAINS.items():
+            cube[grain] = self._rollup(full_df.assign(period=bucket(ts)), ['period'])
+        return cube
+
+class StreamingMetrics:
+    """
+    Incremental MetricsEngine for chunked ingestion.
+    Holds only bounded aggregates (per order, customer and day) plus a uniform
+    review sample, so peak memory is flat regardless of the number of rows.
+    Payments must be fed before orders.
+    """
+
+    def __init__(self, review_sample_size=5000, seed=42):
+        self.review_sample_size = review_sample_size
+        self.rng = np.random.default_rng(seed)
+        self.order_totals = pd.Series(dtype='float64')  # order_id -> paid, drained as orders arrive
+        self.ltv = pd.Series(dtype='float64')  # customer_id -> paid
+        self.last_purchase = pd.Series(dtype='datetime64[ns]')  # customer_id -> last order
+        self.daily_revenue = pd.Series(dtype='float64')  # date -> paid
+        self.review_sample = None
+        self.rows_seen = {"orders": 0, "payments": 0, "reviews": 0}
+
+    def add_payments(self, chunk):
+        self.rows_seen["payments"] += len(chunk)
+        totals = chunk.groupby('order_id', observed=True)['payment_value'].sum()
+        self.order_totals = self.order_totals.add(totals, fill_value=0)
+
+    def add_orders(self, chunk):
+        self.rows_seen["orders"] += len(chunk)
+        chunk = chunk.drop_duplicates('order_id')
+        ts = pd.to_datetime(chunk['order_purchase_timestamp'], errors='coerce')
+
+        # Each order's payments are consumed once (repeated order rows add nothing)
+        paid = chunk['order_id'].map(self.order_totals).fillna(0.0).astype('float64')
+        self.order_totals = self.order_totals.drop(chunk['order_id'], errors='ignore')
+
+        customers = chunk['customer_id']
+        self.ltv = self.ltv.add(paid.groupby(customers, observed=True).sum(), fill_value=0)
+        latest = ts.groupby(customers, observed=True).max()
+        if not self.last_purchase.empty:
+            latest = pd.concat([self.last_purchase, latest]).groupby(level=0).max()
+        self.last_purchase = latest
+        self.daily_revenue = self.daily_revenue.add(paid.groupby(ts.dt.date).sum(), fill_value=0)
+
+    def add_reviews(self, chunk):
+        """Bottom-k sampling: keeps the rows with the k smallest random keys (uniform sample)."""
+        self.rows_seen["reviews"] += len(chunk)
+        text = chunk['review_comment_message'] if 'review_comment_message' in chunk else pd.Series(dtype=object)
+        chunk = chunk[text.fillna("").astype(str).str.len() > 2].copy()
+        chunk['_sample_key'] = self.rng.random(len(chunk))
+        pool = chunk if self.review_sample is None else pd.concat([self.review_sample, chunk])
+        self.review_sample = pool.nsmallest(self.review_sample_size, '_sample_key')
+
+    def results(self):
+        """Final aggregates, shaped like the MetricsEngine outputs."""
+        ltv = self.ltv.rename_axis('customer_id').reset_index(name='ltv')
+
+        recency = self.last_purchase.rename_axis('customer_id').reset_index(name='order_purchase_timestamp')
+        max_date = recency['order_purchase_timestamp'].max()
+        recency['days_since_last_order'] = (max_date - recency['order_purchase_timestamp']).dt.days
+        recency['is_active_30d'] = np.where(recency['days_since_last_order'] <= 30, True, False)
+
+        daily = self.daily_revenue.rename_axis('order_purchase_timestamp').reset_index(name='payment_value')
+        sample = self.review_sample.drop(columns='_sample_key').reset_index(drop=True) if self.review_sample is not None else pd.DataFrame()
+
+        return {
+            "ltv_df": ltv,
+            "churn_df": recency,
+            "daily_revenue": daily,
+            "review_sample": sample,
+            "rows_seen": dict(self.rows_seen),
+        }
+
 def generate_mock_data(data_dir="data"):
     """Generates sample CSVs for testing logic."""
     if not os.path.exists(data_dir):
@@ -261,10 +823,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--test", action="store_true", help="Run with mock data test")
     parser.add_argument("--generate-mock", action="store_true", help="Generate mock data")
+    parser.add_argument("--stream", action="store_true", help="Run the chunked (streaming) aggregation")
+    parser.add_argument("--chunksize", type=int, default=100_000)
     args = parser.parse_args()
 
     if args.generate_mock:
         generate_mock_data()
+
+    if args.stream:
+        print("\n--- Running Streaming Aggregation ---")
+        out = DataIngestor().stream_aggregates(chunksize=args.chunksize)
+        print(f"Rows seen: {out['rows_seen']}")
+        print(out['ltv_df'].head())
+        print(out['daily_revenue'].tail())
+        print(f"Review sample: {len(out['review_sample'])} rows")
     
     if args.test:
         print("\n--- Running Pipeline Test ---")
@@ -276,9 +848,11 @@ if __name__ == "__main__":
         raw_data = ingestor.load_data()
         if raw_data:
             cleaner = DataCleaner()
-            orders = cleaner.clean_orders(raw_data['orders'])
-            reviews = cleaner.clean_reviews(raw_data['reviews'])
-            full_data = cleaner.merge_datasets(orders, raw_data['payments'], reviews)
+            ids = IdDictionary()
+            orders, payments, reviews = cleaner.encode_keys(raw_data['orders'], raw_data['payments'], raw_data['reviews'], ids)
+            orders = cleaner.clean_orders(orders)
+            reviews = cleaner.clean_reviews(reviews)
+            full_data = cleaner.merge_datasets(orders, payments, reviews)
             
             print(f"Merged Data Shape: {full_data.shape}")
             
@@ -0,0 +1,96 @@
+import re
+import hashlib
+from collections import defaultdict
+
+try:
+    from pipeline.lexicon import fold_text
+except ImportError:  # Executed as a script
+    from lexicon import fold_text
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+SIMHASH_BITS = 64
+
+
+def dedup_key(text):
+    """Case, accents, punctuation and emoji removed; whitespace collapsed."""
+    return " ".join(_NON_WORD.sub(" ", fold_text(text)).split())
+
+
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(tokens):
+    """64-bit SimHash over unigrams and bigrams (bigrams keep 'nao recomendo' apart from 'recomendo')."""
+    weights = [0] * SIMHASH_BITS
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for feature in features:
+        h = _feature_hash(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Lowest index stays the root, so the representative is the first occurrence
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def near_duplicate_groups(texts, max_distance=3, min_tokens=4):
+    """
+    Returns rep[i]: the index of the representative (first member) of text i's cluster.
+
+    Texts with the same dedup_key always share a cluster. Texts with at least
+    `min_tokens` tokens also join the cluster of the earliest representative
+    whose SimHash differs from theirs in at most `max_distance` bits, so every
+    member is within the distance of the text whose answer it receives (no
+    chaining through intermediate members). Shorter texts only merge on exact
+    keys, since one word there can flip the meaning. Candidates come from LSH
+    banding: with max_distance + 1 bands, any two hashes within the distance
+    agree on at least one band (pigeonhole), so no representative is missed.
+    """
+    keys = [dedup_key(text) for text in texts]
+    groups = _UnionFind(len(texts))
+
+    first_by_key = {}
+    for i, key in enumerate(keys):
+        if key in first_by_key:
+            groups.union(first_by_key[key], i)
+        else:
+            first_by_key[key] = i
+
+    if max_distance > 0:
+        bands = max_distance + 1
+        width = -(-SIMHASH_BITS // bands)
+        mask = (1 << width) - 1
+        leaders = defaultdict(list)  # (band, band value) -> representatives, in input order
+        hashes = {}
+        for i in first_by_key.values():  # Input order: earlier texts lead
+            if len(keys[i].split()) < min_tokens:
+                continue
+            h = hashes[i] = simhash(keys[i].split())
+            slots = [(band, (h >> (band * width)) & mask) for band in range(bands)]
+            leader = min(
+                (r for slot in slots for r in leaders.get(slot, ()) if bin(hashes[r] ^ h).count("1") <= max_distance),
+                default=None,
+            )
+            if leader is None:
+                for slot in slots:
+                    leaders[slot].append(i)
+            else:
+                groups.union(leader, i)
+
+    return [groups.find(i) for i in range(len(texts))]
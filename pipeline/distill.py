@@ -0,0 +1,176 @@
+import os
+import time
+import pickle
+import argparse
+from collections import Counter
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+
+try:
+    from pipeline.cache import CACHE_DIR, _atomic_write
+except ImportError:  # Executed as a script (python pipeline/distill.py)
+    from cache import CACHE_DIR, _atomic_write
+
+TARGETS = ("sentiment", "category", "urgency")
+
+
+def _documents(texts, scores):
+    """Score travels with the text as a pseudo-token, like the prompt's NOTA context."""
+    docs = []
+    for text, score in zip(texts, scores):
+        try:
+            token = f"nota{int(float(score))}"
+        except (TypeError, ValueError):
+            token = "notana"
+        docs.append(f"{token} {text}")
+    return docs
+
+
+class DistilledClassifier:
+    """
+    TF-IDF + linear models trained on LLM answers from the EnrichmentStore.
+    Predicts the raw (pre-sanity) sentiment / category / urgency the LLM would
+    give, and the action most often paired with that label triple.
+    """
+
+    # Bump when features or artifact layout change; older artifacts are ignored
+    VERSION = 1
+
+    def __init__(self, vectorizer, models, actions, meta):
+        self.vectorizer = vectorizer
+        self.models = models
+        self.actions = actions
+        self.meta = meta
+
+    @staticmethod
+    def default_path():
+        return os.path.join(CACHE_DIR, "models", f"review_distill-v{DistilledClassifier.VERSION}.joblib")
+
+    @classmethod
+    def train(cls, texts, scores, labels, prompt_versions=(), test_size=0.2, seed=42):
+        """
+        `labels` is a list of raw LLM result dicts. Fits on a split, reports held-out
+        agreement with the LLM per target, then refits on everything.
+        """
+        docs = _documents(texts, scores)
+        y = {target: np.array([str(label.get(target, "")) for label in labels], dtype=object) for target in TARGETS}
+
+        def fit(indices):
+            vectorizer = TfidfVectorizer(
+                ngram_range=(1, 2), min_df=2, sublinear_tf=True, strip_accents="unicode", dtype=np.float32
+            )
+            X = vectorizer.fit_transform([docs[i] for i in indices])
+            models = {}
+            for target in TARGETS:
+                classes = set(y[target][indices])
+                if len(classes) < 2:
+                    models[target] = next(iter(classes))  # Constant label
+                else:
+                    models[target] = LogisticRegression(max_iter=1000, C=4.0, class_weight="balanced").fit(X, y[target][indices])
+            return vectorizer, models
+
+        indices = np.arange(len(docs))
+        train_idx, test_idx = train_test_split(indices, test_size=test_size, random_state=seed)
+        held_out = cls(*fit(train_idx), actions={}, meta={})
+        predicted = held_out._predict_labels([docs[i] for i in test_idx])
+        agreement = {target: float(np.mean(predicted[target] == y[target][test_idx])) for target in TARGETS}
+        agreement["all"] = float(np.mean(np.all([predicted[t] == y[t][test_idx] for t in TARGETS], axis=0)))
+
+        actions = {}
+        counts = Counter(
+            (label.get("sentiment"), label.get("category"), label.get("urgency"), label.get("suggested_action"))
+            for label in labels
+        )
+        for (sentiment, category, urgency, action), _ in counts.most_common():
+            actions.setdefault((sentiment, category, urgency), action)
+
+        vectorizer, models = fit(indices)
+        meta = {
+            "version": cls.VERSION,
+            "prompt_versions": list(prompt_versions),
+            "trained_at": time.time(),
+            "samples": len(docs),
+            "held_out": len(test_idx),
+            "agreement": agreement,
+            "sklearn": sklearn.__version__,
+        }
+        return cls(vectorizer, models, actions, meta)
+
+    def _predict_labels(self, docs):
+        X = self.vectorizer.transform(docs)
+        return {
+            target: model.predict(X) if hasattr(model, "predict") else np.full(len(docs), model, dtype=object)
+            for target, model in self.models.items()
+        }
+
+    def predict(self, texts, scores):
+        """List of raw result dicts (sanity checks are the caller's job, as with the LLM)."""
+        labels = self._predict_labels(_documents(texts, scores))
+        results = []
+        for sentiment, category, urgency in zip(labels["sentiment"], labels["category"], labels["urgency"]):
+            results.append({
+                "sentiment": sentiment,
+                "category": category,
+                "urgency": urgency,
+                "suggested_action": self.actions.get((sentiment, category, urgency), "Monitorar"),
+            })
+        return results
+
+    def save(self, path=None):
+        path = path or self.default_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = {"vectorizer": self.vectorizer, "models": self.models, "actions": self.actions, "meta": self.meta}
+        _atomic_write(path, lambda tmp: joblib.dump(payload, tmp, compress=3))
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Returns the stored classifier, or None if missing, unreadable, or built by
+        another VERSION or sklearn release (pickles are not portable across them).
+        """
+        path = path or cls.default_path()
+        try:
+            payload = joblib.load(path)
+        except (OSError, EOFError, ValueError, ImportError, AttributeError, pickle.UnpicklingError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Warning: distilled model at {path} unreadable ({e!r}); retrain with pipeline/distill.py")
+            return None
+        meta = payload.get("meta", {}) if isinstance(payload, dict) else {}
+        if meta.get("version") != cls.VERSION or meta.get("sklearn") != sklearn.__version__:
+            return None
+        return cls(payload["vectorizer"], payload["models"], payload["actions"], payload["meta"])
+
+
+if __name__ == "__main__":
+    try:
+        from pipeline.result_store import EnrichmentStore
+        from pipeline.ai_enricher import PROMPT_VERSION, PACKED_PROMPT_VERSION
+    except ImportError:
+        from result_store import EnrichmentStore
+        from ai_enricher import PROMPT_VERSION, PACKED_PROMPT_VERSION
+
+    parser = argparse.ArgumentParser(description="Distill stored LLM labels into a local classifier")
+    parser.add_argument("--min-samples", type=int, default=500)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    versions = (PROMPT_VERSION, PACKED_PROMPT_VERSION)
+    rows = EnrichmentStore().labelled(versions)
+    print(f"Labelled reviews in store: {len(rows)}")
+    if len(rows) < args.min_samples:
+        raise SystemExit(f"Need at least {args.min_samples} labelled reviews to train")
+
+    texts, scores, labels = zip(*rows)
+    start = time.time()
+    model = DistilledClassifier.train(texts, scores, labels, prompt_versions=versions, test_size=args.test_size)
+    path = model.save(args.out)
+    print(f"Trained on {model.meta['samples']} reviews in {time.time() - start:.1f}s -> {path}")
+    for target, value in model.meta["agreement"].items():
+        print(f"  held-out agreement with LLM [{target}]: {value:.1%}")
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import glob
+import argparse
+
+import pandas as pd
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+try:
+    from pipeline.cache import CACHE_DIR, _atomic_write, file_digest
+    from pipeline.data_processor import DataIngestor
+    from pipeline.ai_enricher import ReviewAnalyzer, PACK_SIZE, ROUTER_THRESHOLD, DEDUP_MAX_DISTANCE, PROMPT_VERSION, PACKED_PROMPT_VERSION
+except ImportError:  # Executed as a script (python pipeline/enrich_all.py)
+    from cache import CACHE_DIR, _atomic_write, file_digest
+    from data_processor import DataIngestor
+    from ai_enricher import ReviewAnalyzer, PACK_SIZE, ROUTER_THRESHOLD, DEDUP_MAX_DISTANCE, PROMPT_VERSION, PACKED_PROMPT_VERSION
+
+DEFAULT_OUTPUT = os.path.join(CACHE_DIR, "enriched")
+
+# Same columns the command center adds (see _enrich_rows in app/main.py)
+RESULT_COLUMNS = {
+    "sentiment": "Sentimento_IA",
+    "category": "Categoria_IA",
+    "urgency": "Urgencia_IA",
+    "suggested_action": "Acao_Sugerida",
+}
+KEEP_COLUMNS = ["review_id", "order_id", "review_score", "review_comment_message"]
+
+# Options that change the answers (defaults of analyze_batch_async_as_completed);
+# a checkpointed run only resumes under the same values
+RUN_OPTIONS = {"pack_size": 1, "threshold": None, "dedup": None}
+
+
+def count_rows(path):
+    """Streaming row count (one column, quoted line breaks allowed) for the ETA."""
+    reader = pa_csv.open_csv(
+        path,
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(include_columns=["review_id"]),
+    )
+    return sum(batch.num_rows for batch in reader)
+
+
+class CorpusEnricher:
+    """
+    Enriches a reviews file chunk by chunk through ReviewAnalyzer.
+
+    Chunk k covers input rows [k*N, (k+1)*N) and is checkpointed atomically as
+    part-<k>.parquet, so a rerun skips every chunk already on disk and resumes
+    at the first missing one. The manifest pins the source content, chunk size,
+    prompt versions and the RUN_OPTIONS; a mismatch refuses to mix outputs
+    unless restarted.
+    """
+
+    def __init__(self, source, output_dir=DEFAULT_OUTPUT, checkpoint_rows=2000, analyzer=None, **options):
+        self.source = source
+        self.output_dir = output_dir
+        self.checkpoint_rows = checkpoint_rows
+        self.analyzer = analyzer or ReviewAnalyzer()
+        self.options = options  # Forwarded to analyze_batch_async_as_completed
+
+    def _part_path(self, k):
+        return os.path.join(self.output_dir, f"part-{k:06d}.parquet")
+
+    def _manifest(self, previous=None):
+        stat = os.stat(self.source)
+        # Content fingerprint; hashing is skipped while size and mtime are unchanged
+        # (a `touch` or a fresh checkout only costs one re-hash)
+        if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+            digest = previous.get("sha256")
+        else:
+            digest = file_digest(self.source)
+        return {
+            "source": os.path.abspath(self.source),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+            "checkpoint_rows": self.checkpoint_rows,
+            "prompt_version": PROMPT_VERSION,
+            "packed_prompt_version": PACKED_PROMPT_VERSION,
+            "options": {name: self.options.get(name, default) for name, default in RUN_OPTIONS.items()},
+        }
+
+    def _prepare(self, restart):
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest_path = os.path.join(self.output_dir, "manifest.json")
+        previous = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                previous = json.load(f)
+        manifest = self._manifest(None if restart else previous)
+        if restart:
+            for path in glob.glob(os.path.join(self.output_dir, "part-*.parquet")):
+                os.remove(path)
+        elif previous is not None:
+            changed = [k for k in manifest if k != "mtime_ns" and previous.get(k) != manifest[k]]
+            if changed:
+                raise SystemExit(
+                    f"{self.output_dir} holds a run for a different source/settings ({', '.join(changed)}); "
+                    "use --restart to discard it"
+                )
+
+        def write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(manifest, f, indent=2)
+        _atomic_write(manifest_path, write)
+
+    def _enrich_chunk(self, chunk):
+        reviews_data = [
+            {"text": text, "score": score}
+            for text, score in zip(chunk["review_comment_message"], chunk["review_score"])
+        ]
+        results = [None] * len(reviews_data)
+        for i, result in self.analyzer.analyze_batch_async_as_completed(reviews_data, **self.options):
+            results[i] = result
+
+        enriched = chunk[[c for c in KEEP_COLUMNS if c in chunk.columns]].copy()
+        for key, column in RESULT_COLUMNS.items():
+            enriched[column] = [r[key] for r in results]
+        enriched["Origem_IA"] = [r["provenance"]["source"] for r in results]
+        enriched["Erro_IA"] = [r["provenance"]["error"] for r in results]
+        enriched["prompt_version"] = [r["provenance"]["prompt_version"] for r in results] # None: no prompt answered
+        return enriched, sum(1 for r in results if r["provenance"]["error"])
+
+    def run(self, limit=None, restart=False):
+        self._prepare(restart)
+        total = count_rows(self.source)
+        if limit:
+            total = min(total, limit)
+
+        done = skipped = fallbacks = 0
+        start = time.time()
+        chunks = DataIngestor().iter_chunks("reviews", self.source, chunksize=self.checkpoint_rows)
+        for k, chunk in enumerate(chunks):
+            offset = k * self.checkpoint_rows
+            if offset >= total:
+                break
+            chunk = chunk.iloc[:total - offset]
+            path = self._part_path(k)
+            if os.path.exists(path) and pq.read_metadata(path).num_rows == len(chunk):
+                skipped += len(chunk)
+                continue  # Checkpointed (a shorter part came from an earlier --limit and is redone)
+
+            enriched, errors = self._enrich_chunk(chunk)
+            _atomic_write(path, lambda tmp: enriched.to_parquet(tmp, index=False))
+            done += len(chunk)
+            fallbacks += errors
+
+            elapsed = time.time() - start
+            rate = done / elapsed if elapsed else 0.0
+            remaining = total - skipped - done
+            eta = remaining / rate if rate else float("inf")
+            print(
+                f"[{skipped + done}/{total}] {rate:.1f} reviews/s | ETA {eta / 60:.1f} min | "
+                f"fallback {fallbacks}/{done} ({fallbacks / done:.1%}) | API calls {self.analyzer.api_calls}"
+            )
+
+        elapsed = time.time() - start
+        print(f"Done: {done} enriched, {skipped} already checkpointed, {elapsed:.1f}s -> {self.output_dir}")
+        return {"enriched": done, "skipped": skipped, "fallbacks": fallbacks, "elapsed": elapsed}
+
+
+def load_enriched(output_dir=DEFAULT_OUTPUT):
+    """All checkpointed chunks as one frame (input order)."""
+    paths = sorted(glob.glob(os.path.join(output_dir, "part-*.parquet")))
+    if not paths:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enrich the full reviews table with checkpointing and resume")
+    parser.add_argument("--source", default=os.path.join("data", DataIngestor.LOCAL_FILES["reviews"]))
+    parser.add_argument("--out", default=DEFAULT_OUTPUT)
+    parser.add_argument("--checkpoint-rows", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64, help="Max requests in flight")
+    parser.add_argument("--pack-size", type=int, default=PACK_SIZE)
+    parser.add_argument("--no-router", action="store_true", help="Send every review to the LLM")
+    parser.add_argument("--no-dedup", action="store_true", help="Do not collapse near-duplicates")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N reviews")
+    parser.add_argument("--restart", action="store_true", help="Discard existing checkpoints")
+    args = parser.parse_args()
+
+    enricher = CorpusEnricher(
+        args.source,
+        output_dir=args.out,
+        checkpoint_rows=args.checkpoint_rows,
+        max_in_flight=args.concurrency,
+        pack_size=args.pack_size,
+        threshold=None if args.no_router else ROUTER_THRESHOLD,
+        dedup=None if args.no_dedup else DEDUP_MAX_DISTANCE,
+    )
+    enricher.run(limit=args.limit, restart=args.restart)
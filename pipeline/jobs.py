@@ -0,0 +1,220 @@
+import time
+import uuid
+import queue
+import threading
+from collections import Counter
+
+try:
+    from pipeline.ai_enricher import _is_blank
+except ImportError:  # Executed as a script
+    from ai_enricher import _is_blank
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+FINISHED = (DONE, CANCELLED, FAILED)
+
+
+class Job:
+    """
+    One enrichment batch. `results` is aligned with `reviews_data` and filled by
+    index as items complete; None marks what is still pending (what resume sends).
+    `context` is opaque caller data kept with the job (e.g. the target rows).
+    """
+
+    def __init__(self, job_id, reviews_data, options, context=None):
+        self.id = job_id
+        self.reviews_data = reviews_data
+        self.options = options
+        self.context = context
+        self.results = [None] * len(reviews_data)
+        self.completed = 0
+        self.status = QUEUED
+        self.error = None
+        self.stats = {}
+        self.submitted = time.time()
+        self.queued = None # time.monotonic() of the last (re)queue, for queue positions
+        self.finished = None
+        self.elapsed = 0.0  # Run time, summed over resumes
+        self.cancel_requested = threading.Event()
+
+    def pending(self):
+        return [i for i, result in enumerate(self.results) if result is None]
+
+    def snapshot(self):
+        """Plain-dict progress view, safe to read from any thread."""
+        total = len(self.results)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": total,
+            "completed": self.completed,
+            "progress": self.completed / total if total else 1.0,
+            "elapsed": self.elapsed,
+            "error": self.error,
+            "stats": dict(self.stats),
+        }
+
+
+class JobManager:
+    """
+    Process-level queue of enrichment jobs, run one at a time by a daemon worker
+    thread outside any Streamlit script run. A single ReviewAnalyzer serves every
+    job, so all of them share one rate limiter (one API key).
+
+    submit -> job id; poll -> snapshot; cancel stops a job after the requests in
+    flight give up; resume re-queues a cancelled or failed job with only the
+    items that never completed.
+    """
+
+    def __init__(self, analyzer_factory, keep=20):
+        self._analyzer_factory = analyzer_factory
+        self._analyzer = None
+        self._jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self.keep = keep  # Finished jobs kept in memory
+
+    # --- API ---
+
+    def submit(self, reviews_data, context=None, **options):
+        """Queues a batch; `options` go to ReviewAnalyzer.analyze_batch_async_as_completed."""
+        job = Job(uuid.uuid4().hex[:12], list(reviews_data), options, context)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._enqueue(job)
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def poll(self, job_id):
+        """Snapshot plus `ahead`: jobs that will run before this one (0 once it runs)."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        snapshot = job.snapshot()
+        snapshot["ahead"] = self.ahead(job)
+        return snapshot
+
+    def ahead(self, job):
+        """Jobs the single worker runs before `job`: the running one and earlier queued ones."""
+        if job.status != QUEUED:
+            return 0
+        with self._lock:
+            others = [other for other in self._jobs.values() if other is not job]
+        return sum(
+            1 for other in others
+            if other.status == RUNNING
+            or (other.status == QUEUED and not other.cancel_requested.is_set() and other.queued < job.queued)
+        )
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.cancel_requested.set()
+        return True
+
+    def resume(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status not in (CANCELLED, FAILED) or not job.pending():
+            return False
+        job.cancel_requested.clear()
+        job.status, job.error, job.finished = QUEUED, None, None
+        self._enqueue(job)
+        return True
+
+    # --- worker ---
+
+    def _enqueue(self, job):
+        job.queued = time.monotonic()
+        self._queue.put(job)
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, name="enrichment-jobs", daemon=True)
+                self._worker.start()
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.status in FINISHED]
+        for job in sorted(finished, key=lambda job: job.submitted)[:max(0, len(finished) - self.keep)]:
+            del self._jobs[job.id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job.cancel_requested.is_set():
+                job.status, job.finished = CANCELLED, time.time()
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                job.status, job.error = FAILED, repr(e)
+                print(f"Enrichment job {job.id} failed: {e}")
+            finally:
+                job.finished = time.time()
+
+    def _run(self, job):
+        if self._analyzer is None:
+            self._analyzer = self._analyzer_factory()
+        analyzer = self._analyzer
+
+        pending = job.pending()
+        items = [job.reviews_data[i] for i in pending]
+        calls_before = analyzer.api_calls
+        job.status = RUNNING
+        start, elapsed_before = time.monotonic(), job.elapsed
+        try:
+            for j, result in analyzer.analyze_batch_async_as_completed(items, **job.options):
+                if job.cancel_requested.is_set():
+                    # Outstanding requests give up at their next attempt; their
+                    # fallbacks are drained and dropped so resume re-sends them
+                    analyzer.cancel()
+                    continue
+                job.results[pending[j]] = result
+                job.completed += 1
+                job.elapsed = elapsed_before + time.monotonic() - start
+        finally:
+            job.elapsed = elapsed_before + time.monotonic() - start
+            job.stats = self._job_stats(job, job.stats.get("api_calls", 0) + analyzer.api_calls - calls_before)
+        job.status = CANCELLED if job.cancel_requested.is_set() else DONE
+
+    @staticmethod
+    def _job_stats(job, api_calls):
+        """
+        Counters over every result kept so far, so they add up across resumes
+        (the analyzer's routing/dedup reports only describe its last batch).
+        """
+        results = [r for r in job.results if r]
+        blanks = sum(1 for item, r in zip(job.reviews_data, job.results) if r and _is_blank(item['text']))
+        sources = Counter(r.get("provenance", {}).get("source") for r in results)
+        stats = {
+            "api_calls": api_calls,
+            "fallbacks": sum(1 for r in results if r.get("provenance", {}).get("error")),
+            "routing": None,
+            "dedup": None,
+        }
+        routed = sources["router"]
+        if job.options.get("threshold") is not None:
+            stats["routing"] = {
+                "threshold": job.options["threshold"],
+                "total": len(results),
+                "skipped": routed,
+                "skipped_share": routed / len(results) if results else 0.0,
+            }
+        if job.options.get("dedup") is not None:
+            texts = len(results) - routed - blanks  # What reached the dedup stage
+            stats["dedup"] = {
+                "max_distance": job.options["dedup"],
+                "texts": texts,
+                "collapsed": sources["dedup"],
+                "collapsed_share": sources["dedup"] / texts if texts else 0.0,
+            }
+        return stats
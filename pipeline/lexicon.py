@@ -0,0 +1,139 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+
+_COMMON_MARKS = re.compile("[\u0300-\u036f]")
+
+
+def fold_text(text):
+    """Rule-engine normalization: lowercase, accents stripped (NFKD)."""
+    text = str(text).lower()
+    if text.isascii():
+        return text
+    text = _COMMON_MARKS.sub("", unicodedata.normalize("NFKD", text))
+    if text.isascii():
+        return text
+    return "".join(c for c in text if not unicodedata.combining(c))  # Rare marks outside the common block
+
+
+def _trie_pattern(words):
+    """
+    Regex for a set of literals, factored as a prefix trie (`ab(?:c|d)`) so the
+    engine branches once per character instead of retrying every alternative.
+    Optional tails are greedy, so the longest literal at a position wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        ends = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if ends:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+def fold_series(texts):
+    """Vectorized fold_text over a Series; returns string[pyarrow]."""
+    texts = texts.astype("string[pyarrow]")
+    folded = texts.str.lower().str.normalize("NFKD").str.replace(_COMMON_MARKS.pattern, "", regex=True)
+    rare = folded.str.contains(r"[^\x00-\x7f]", regex=True).fillna(False)
+    if rare.any():
+        folded[rare] = texts[rare].map(fold_text)
+    return folded
+
+
+class LexiconMatcher:
+    """
+    Substring lexicons compiled into one trie-shaped alternation regex.
+
+    `categories(text)` returns every category with at least one trigger that
+    occurs in `text` as a substring, in a single left-to-right scan. At each
+    start position the longest trigger wins; the triggers that are prefixes of
+    it are credited through a precomputed prefix closure, and the scan resumes
+    one character after each match start so overlapping triggers are still
+    seen. The result is exactly
+    `{c for c, words in lexicons.items() if any(w in text for w in words)}`.
+    """
+
+    def __init__(self, lexicons):
+        self.lexicons = {name: tuple(words) for name, words in lexicons.items()}
+
+        owners = {}
+        for name, words in self.lexicons.items():
+            for word in words:
+                owners.setdefault(word, set()).add(name)
+
+        self._closure = {
+            word: frozenset().union(*(owners[other] for other in owners if word.startswith(other)))
+            for word in owners
+        }
+        self.pattern = re.compile(_trie_pattern(owners))
+
+    def categories(self, text):
+        hits = set()
+        search = self.pattern.search
+        match = search(text)
+        while match:
+            hits |= self._closure[match.group()]
+            match = search(text, match.start() + 1)
+        return hits
+
+    def category_pattern(self, name):
+        """Regex for one category alone (vectorized `str.contains`)."""
+        return _trie_pattern(self.lexicons[name])
+
+    def contains(self, texts, name):
+        """Boolean mask: rows of a string Series with a `name` trigger (NA -> False)."""
+        return texts.str.contains(self.category_pattern(name), regex=True).fillna(False).to_numpy(bool)
+
+
+# Rule engine lexicons (matched against fold_text)
+RULE_LEXICONS = LexiconMatcher({
+    "not_recommended": ["nao recomendo", "nao indico"],
+    "urgency_high": ["processo", "procon", "justiça", "advogado", "nunca mais", "lixo", "golpe", "roubo"],
+    "logistics": ["atraso", "demorou", "nao chegou", "extraviado", "sumiu", "correios", "entrega"],
+    "quality": ["quebrado", "defeito", "falha", "estragado", "pior", "horrivel", "falsificado"],
+    "support": ["grosso", "mal educado", "ignora", "descaso", "atendimento", "sac"],
+    "general_bad": ["ruim", "pessimo", "terrivel", "odiei", "triste", "insatisfeito"],
+    "positive": ["bom", "otimo", "excelente", "amei", "gostei", "recomendo", "top", "show", "perfeito"],
+})
+
+# Sanity-check lexicons (matched against the lowercased raw text, accents kept)
+SANITY_LEXICONS = LexiconMatcher({
+    "urgency_alta": [
+        "atraso", "não recebi", "extraviado", "quebrado", "defeito", "procon", "justiça",
+        "triste", "decepcionado", "chateado", "nunca mais", "indignado", "vergonha", "absurdo", "lixo",
+    ],
+    "acolhimento": ["triste", "decepcionado"],
+    "positive": ["parabéns", "excelente", "perfeito", "amei", "recomendo", "ótimo", "maravilhoso"],
+})
+
+
+# Categories that count as negative evidence (incl. lexicons the rule table does not branch on)
+NEGATIVE_CATEGORIES = frozenset({"not_recommended", "urgency_high", "logistics", "quality", "support", "general_bad"})
+
+# Contrast markers: the rule engine cannot follow a polarity flip ("bom, mas atrasou")
+ADVERSATIVE = re.compile(r"\b(?:mas|porem|entretanto|contudo|todavia|no entanto)\b")
+
+
+@lru_cache(maxsize=1 << 17)
+def rule_hits(text):
+    """Memoized rule-lexicon categories of a review text."""
+    return frozenset(RULE_LEXICONS.categories(fold_text(text)))
+
+
+@lru_cache(maxsize=1 << 17)
+def sanity_hits(text):
+    """Memoized sanity-lexicon categories of a review text."""
+    return frozenset(SANITY_LEXICONS.categories(str(text).lower()))
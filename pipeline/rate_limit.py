@@ -0,0 +1,239 @@
+import re
+import time
+import asyncio
+import threading
+from collections import deque
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SCALE = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value):
+    """Parses provider reset values such as '7.66s', '2m59.56s' or '120ms' into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)  # Plain seconds (retry-after)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_SCALE[unit] for amount, unit in parts)
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Per-minute budget (requests or tokens). `reserve` takes `amount` from the
+    bucket and returns how long the caller must wait before sending; the
+    bucket may go negative so concurrent callers queue up in order.
+    A limit of None means "unknown yet": nothing is throttled until the
+    provider headers calibrate it.
+    """
+
+    def __init__(self, per_minute=None):
+        self._lock = threading.Lock()
+        self.capacity = per_minute
+        self.level = per_minute or 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def reserve(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self.blocked_until - now)
+            if self.capacity:
+                self.level -= amount
+                if self.level < 0:
+                    wait = max(wait, -self.level * 60.0 / self.capacity)
+            return wait
+
+    def calibrate(self, limit=None, remaining=None, reset=None):
+        """Aligns the bucket with what the provider reports."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            uncalibrated = self.capacity is None
+            if limit:
+                self.capacity = limit
+            if remaining is not None:
+                # First calibration: the level was a placeholder 0, trust the provider
+                self.level = remaining if uncalibrated else min(self.level, remaining)
+                if remaining <= 0 and reset:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+
+    def block(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AimdController:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit: +1 after a
+    full window of successes, halved at most once per round trip on throttling.
+    A burst of 429s answers requests that were all sent at the old rate, so
+    only a throttle for a request sent after the last decrease halves again
+    (like TCP's one reduction per window). Until the first throttle it grows
+    like TCP slow start (doubling per window).
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=256, decrease=0.5):
+        self._lock = threading.Lock()
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.slow_start = True
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._last_decrease = float("-inf")  # time.monotonic() of the last halving
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def on_success(self):
+        with self._lock:
+            step = 1.0 if self.slow_start else 1.0 / self._limit
+            self._limit = min(self.maximum, self._limit + step)
+
+    def on_throttle(self, sent_at=None):
+        """
+        Halves the limit unless the throttled request was sent (time.monotonic())
+        before the last decrease. Returns whether the limit changed.
+        """
+        with self._lock:
+            if sent_at is not None and sent_at < self._last_decrease:
+                return False
+            self.slow_start = False
+            self._limit = max(self.minimum, self._limit * self.decrease)
+            self._last_decrease = time.monotonic()
+            return True
+
+
+class RateLimiter:
+    """
+    Client-side pacing for one API key: a request bucket (GROQ_RPM and 429s),
+    a token bucket fed by the x-ratelimit-*-tokens headers, plus an AIMD
+    concurrency limit. Groq's *-requests headers describe the daily quota
+    (RPD), so they never size the per-minute request bucket; they only pause
+    it once the day's quota is spent.
+    """
+
+    def __init__(self, rpm=None, tpm=None, initial_concurrency=8, max_concurrency=256):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AimdController(initial_concurrency, maximum=max_concurrency)
+        self._gate = threading.Condition()
+        self._in_flight = 0
+        self._waiters = deque()  # (loop, future) of coroutines waiting for a slot
+        self.throttled = 0
+
+    # --- pacing ---
+
+    def _delay(self, tokens):
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens):
+        """Blocks until a request of ~`tokens` may be sent (threads)."""
+        with self._gate:
+            self._gate.wait_for(lambda: self._in_flight < self.concurrency.limit)
+            self._in_flight += 1
+        delay = self._delay(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens):
+        """
+        Awaits until a request of ~`tokens` may be sent (event loop). Without a
+        free slot the coroutine parks on a future that release() resolves with
+        the slot already reserved for it; no polling.
+        """
+        loop = asyncio.get_running_loop()
+        with self._gate:
+            if self._in_flight < self.concurrency.limit and not self._waiters:
+                self._in_flight += 1
+                waiter = None
+            else:
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+        if waiter is not None:
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release()  # Granted just before the cancellation landed
+                raise
+        delay = self._delay(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _wake(self):
+        """Hands free slots to parked coroutines in arrival order (call with the gate held)."""
+        while self._waiters and self._in_flight < self.concurrency.limit:
+            loop, waiter = self._waiters.popleft()
+            self._in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, waiter)
+            except RuntimeError:  # Loop already closed: the slot goes back
+                self._in_flight -= 1
+
+    def _grant(self, waiter):
+        if waiter.cancelled():
+            self.release()  # Reserved for a coroutine that gave up waiting
+        else:
+            waiter.set_result(None)
+
+    def release(self):
+        with self._gate:
+            self._in_flight -= 1
+            self._wake()
+            self._gate.notify_all()
+
+    # --- feedback ---
+
+    def on_response(self, headers):
+        """Success: calibrate the token bucket from the rate-limit headers and grow concurrency."""
+        headers = headers or {}
+        daily_remaining = _header_float(headers, "x-ratelimit-remaining-requests")
+        daily_reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if daily_remaining is not None and daily_remaining <= 0 and daily_reset:
+            self.requests.block(daily_reset)
+        self.tokens.calibrate(
+            _header_float(headers, "x-ratelimit-limit-tokens"),
+            _header_float(headers, "x-ratelimit-remaining-tokens"),
+            parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+        self.concurrency.on_success()
+        with self._gate:
+            self._wake()  # The limit may have grown
+            self._gate.notify_all()
+
+    def on_throttle(self, headers, sent_at=None):
+        """
+        429: pause both buckets for retry-after (or the token reset when the
+        token budget is spent) and back off. `sent_at` (time.monotonic() when
+        the request went out) lets AIMD ignore throttles from before its last
+        decrease. The *-requests reset is the daily quota's and is not used.
+        """
+        headers = headers or {}
+        self.throttled += 1
+        tokens_left = _header_float(headers, "x-ratelimit-remaining-tokens")
+        token_reset = parse_duration(headers.get("x-ratelimit-reset-tokens")) if tokens_left is not None and tokens_left <= 0 else None
+        wait = parse_duration(headers.get("retry-after")) or token_reset or 1.0
+        self.requests.block(wait)
+        self.tokens.block(wait)
+        self.concurrency.on_throttle(sent_at)
+        return wait
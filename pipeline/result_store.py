@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+try:
+    from pipeline.cache import CACHE_DIR
+except ImportError:  # Executed as a script
+    from cache import CACHE_DIR
+
+
+def normalize_review_text(text):
+    """Cache-key normalization: Unicode NFKC, lowercase, collapsed whitespace."""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    return " ".join(text.split())
+
+
+class EnrichmentStore:
+    """
+    Durable SQLite store of LLM enrichment results, shared by every session
+    and analyst. Keys combine the normalized review text, the score and the
+    prompt/model version, so a prompt change simply stops matching old rows.
+    A small in-process LRU sits in front of SQLite for repeat lookups.
+    """
+
+    def __init__(self, path=None, memory_items=10_000):
+        self.path = path or os.path.join(CACHE_DIR, "enrichment.sqlite")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_items = memory_items
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # Concurrent readers across processes
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " version TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        # Review text/score next to the answer: the training set for pipeline/distill.py
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+        for name, kind in (("text", "TEXT"), ("score", "INTEGER")):
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE results ADD COLUMN {name} {kind}")
+        self._conn.commit()
+
+    @staticmethod
+    def _score_int(score):
+        return None if score is None or score != score else int(float(score))  # NaN-safe
+
+    @staticmethod
+    def make_key(text, score, version):
+        score_int = EnrichmentStore._score_int(score)
+        score_part = "" if score_int is None else str(score_int)
+        raw = f"{version}\0{score_part}\0{normalize_review_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self._memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns a fresh copy of the stored result dict, or None."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Bulk lookup: {key: result} for the keys that are stored."""
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+
+            for start in range(0, len(missing), 500):  # SQLite variable limit
+                batch = missing[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, result FROM results WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, payload in rows:
+                    found[key] = payload
+                    self._remember(key, payload)
+
+        return {key: json.loads(payload) for key, payload in found.items()}
+
+    def put(self, key, result, version="", text=None, score=None):
+        payload = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, version, result, created_at, text, score) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, version, payload, time.time(), None if text is None else str(text), self._score_int(score)),
+            )
+            self._conn.commit()
+            self._remember(key, payload)
+
+    def labelled(self, versions):
+        """(text, score, raw result) rows written by the given prompt versions."""
+        placeholders = ",".join("?" * len(versions))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT text, score, result FROM results WHERE text IS NOT NULL AND version IN ({placeholders})",
+                list(versions),
+            ).fetchall()
+        return [(text, score, json.loads(payload)) for text, score, payload in rows]
+
+    def purge(self, keep_version):
+        """Deletes rows written by other prompt/model versions; returns the count."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM results WHERE version != ?", (keep_version,))
+            self._conn.commit()
+            self._memory.clear()
+            return cursor.rowcount
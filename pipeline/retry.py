@@ -0,0 +1,75 @@
+import random
+import asyncio
+
+import groq
+
+# Error classes used for retry decisions and provenance
+RETRYABLE = "retryable"      # 5xx, timeouts, dropped connections
+RATE_LIMITED = "rate_limited"  # 429
+PARSE = "parse"              # Answer arrived but is not the JSON we asked for
+DEADLINE = "deadline"        # Batch deadline passed before the request could be (re)sent
+CANCELLED = "cancelled"      # The batch was cancelled (e.g. a job cancel)
+FATAL = "fatal"              # Auth, bad request, client bugs... retrying will not help
+
+
+class DeadlineExceeded(Exception):
+    """The batch deadline passed before the request could be (re)sent."""
+
+
+class Cancelled(DeadlineExceeded):
+    """The batch was cancelled; outstanding requests stop like at a deadline."""
+
+
+class ResponseParseError(ValueError):
+    """The answer arrived but could not be parsed into what the prompt asked for."""
+
+
+class EnrichmentError(Exception):
+    """A request that exhausted its retries; carries the error class and retry count."""
+
+    def __init__(self, kind, retries, cause=None):
+        super().__init__(f"{kind} after {retries} retries: {cause}")
+        self.kind = kind
+        self.retries = retries
+
+
+def classify_error(exc):
+    if isinstance(exc, ResponseParseError):
+        return PARSE  # Only the parse step; a ValueError anywhere else is a bug, not a bad answer
+    if isinstance(exc, (Cancelled, asyncio.CancelledError)):
+        return CANCELLED
+    if isinstance(exc, DeadlineExceeded):
+        return DEADLINE
+    if isinstance(exc, groq.RateLimitError):
+        return RATE_LIMITED
+    if isinstance(exc, (groq.APITimeoutError, groq.APIConnectionError, groq.InternalServerError)):
+        return RETRYABLE
+    if isinstance(exc, groq.APIStatusError):
+        return RETRYABLE if exc.status_code in (408, 409) or exc.status_code >= 500 else FATAL
+    return FATAL
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter. Rate-limited retries wait on the rate
+    limiter instead, so their backoff here is only a small jitter.
+    """
+
+    def __init__(self, max_retries=3, parse_retries=1, base=0.5, cap=20.0, timeout=30.0):
+        self.max_retries = max_retries
+        self.parse_retries = parse_retries
+        self.base = base
+        self.cap = cap
+        self.timeout = timeout  # Per-request timeout (seconds)
+
+    def should_retry(self, kind, attempt):
+        if kind in (FATAL, DEADLINE, CANCELLED):
+            return False
+        if kind == PARSE:
+            return attempt < self.parse_retries
+        return attempt < self.max_retries
+
+    def backoff(self, kind, attempt):
+        if kind == RATE_LIMITED:
+            return random.uniform(0, self.base)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
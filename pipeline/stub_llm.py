@@ -0,0 +1,259 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from pipeline.lexicon import rule_hits
+    from pipeline.ai_enricher import ReviewAnalyzer, MODEL_NAME
+except ImportError:  # Executed as a script (python pipeline/stub_llm.py)
+    from lexicon import rule_hits
+    from ai_enricher import ReviewAnalyzer, MODEL_NAME
+
+# Groq's OpenAI-compatible route (the SDK appends it to base_url)
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+_SINGLE_TEXT = re.compile(r'^TEXTO: "(.*)"$', re.DOTALL)
+
+
+def rule_answer(text):
+    """Deterministic label for a review: first RULE_TABLE lexicon it hits (same table as the rule engine)."""
+    hits = rule_hits(str(text))
+    for lexicon, sentiment, category, urgency, action in ReviewAnalyzer.RULE_TABLE:
+        if lexicon in hits:
+            break
+    else:
+        sentiment, category, urgency, action = ReviewAnalyzer.RULE_DEFAULT
+    return {"sentiment": sentiment, "category": category, "urgency": urgency, "suggested_action": action}
+
+
+class StubConfig:
+    """
+    Behaviour of the stub. Latency is lognormal around `latency_ms` (median)
+    with shape `latency_sigma` (0 = fixed), plus `per_item_ms` per review in
+    packed requests. Rates are per-request probabilities; `rpm` adds a real
+    sliding-window request limit answered with 429 + rate-limit headers.
+    """
+
+    def __init__(self, latency_ms=300.0, latency_sigma=0.5, per_item_ms=20.0, error_rate=0.0,
+                 throttle_rate=0.0, malformed_rate=0.0, rpm=None, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.per_item_ms = per_item_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.malformed_rate = malformed_rate
+        self.rpm = rpm
+        self.seed = seed
+
+
+class StubState:
+    """Shared counters and the RPM window (handlers run on many threads)."""
+
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.window = collections.deque()
+        self.stats = collections.Counter()
+        self.in_flight = 0
+
+    def admit(self):
+        """Returns (status, headers) for a new request: 200, 429 or 5xx."""
+        config = self.config
+        with self.lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            while self.window and now - self.window[0] > 60:
+                self.window.popleft()
+            if config.rpm and len(self.window) >= config.rpm:
+                reset = 60 - (now - self.window[0])
+                return 429, {"retry-after": f"{reset:.2f}", "x-ratelimit-remaining-requests": "0",
+                             "x-ratelimit-reset-requests": f"{reset:.2f}s"}
+            roll = self.random.random()
+            if roll < config.throttle_rate:
+                return 429, {"retry-after": "1"}
+            if roll < config.throttle_rate + config.error_rate:
+                return self.random.choice((500, 502, 503)), {}
+            self.window.append(now)
+            limit = config.rpm or 100000
+            return 200, {
+                "x-ratelimit-limit-requests": str(limit),
+                "x-ratelimit-remaining-requests": str(limit - len(self.window)),
+                "x-ratelimit-reset-requests": "1s",
+            }
+
+    def latency(self, items):
+        config = self.config
+        with self.lock:
+            factor = self.random.lognormvariate(0, config.latency_sigma) if config.latency_sigma else 1.0
+        return (config.latency_ms * factor + config.per_item_ms * items) / 1000.0
+
+    def malformed(self):
+        with self.lock:
+            return self.random.random() < self.config.malformed_rate
+
+
+def answer(messages):
+    """(content, reviews answered) for a single or packed ReviewAnalyzer prompt."""
+    user = messages[-1]["content"] if messages else ""
+    if user.startswith("["):
+        items = json.loads(user)
+        results = [dict(rule_answer(item.get("texto", "")), i=item.get("i")) for item in items]
+        return json.dumps({"results": results}, ensure_ascii=False), len(items)
+    match = _SINGLE_TEXT.match(user)
+    return json.dumps(rule_answer(match.group(1) if match else user), ensure_ascii=False), 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None  # StubState, bound per server
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API: no reconnect per request
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown any benchmark output
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        state = self.state
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        status, headers = state.admit()
+        with state.lock:
+            state.stats[f"status_{status}"] += 1
+        if status != 200:
+            self._send_json(status, {"error": {"message": f"stub injected {status}", "type": "stub"}}, headers)
+            return
+
+        content, items = answer(request.get("messages", []))
+        with state.lock:
+            state.in_flight += 1
+            state.stats["peak_in_flight"] = max(state.stats["peak_in_flight"], state.in_flight)
+        try:
+            time.sleep(state.latency(items))
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+        if state.malformed():
+            content = "Desculpe, não consegui analisar essa avaliação."
+            with state.lock:
+                state.stats["malformed"] += 1
+
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 3
+        completion_tokens = len(content) // 3
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{state.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", MODEL_NAME),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }, headers)
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    # Class attributes: the constructor calls listen() with request_queue_size,
+    # so setting it on the instance afterwards leaves the backlog at 5
+    request_queue_size = 1024  # Bursts of hundreds of connections
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # A client that gave up (cancelled batch, timeout) is not a stub failure
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubLLMServer:
+    """
+    Local chat-completions server for load and latency testing. Point a
+    ReviewAnalyzer at it with base_url=server.url (or GROQ_BASE_URL).
+    Usable as a context manager; port 0 picks a free port.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        self.config = config or StubConfig()
+        self.state = StubState(self.config)
+        handler = type("BoundStubHandler", (StubHandler,), {"state": self.state})
+        self.httpd = _StubHTTPServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        with self.state.lock:
+            return dict(self.state.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Groq/OpenAI-compatible stub for ReviewAnalyzer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal shape (0 = fixed)")
+    parser.add_argument("--per-item-ms", type=float, default=20.0, help="Extra latency per packed review")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of 5xx answers")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of random 429s")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of non-JSON answers")
+    parser.add_argument("--rpm", type=int, default=None, help="Sliding-window request limit")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, per_item_ms=args.per_item_ms,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, malformed_rate=args.malformed_rate,
+        rpm=args.rpm, seed=args.seed,
+    )
+    server = StubLLMServer(args.host, args.port, config)
+    print(f"Stub LLM listening on {server.url} (GROQ_BASE_URL={server.url})", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
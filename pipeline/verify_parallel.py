@@ -2,15 +2,17 @@
 import sys
 import os
 import time
+import argparse
 
 # Add root to path so we can import as if we are in the root
 sys.path.append(os.getcwd())
 
 from pipeline.ai_enricher import ReviewAnalyzer
+from pipeline.stub_llm import StubLLMServer, StubConfig
 
-def test_parallel():
-    analyzer = ReviewAnalyzer()
-    print(f"Analyzer Mode: {'Mock' if analyzer.mock_mode else 'Live AI'}")
+def test_parallel(base_url=None):
+    analyzer = ReviewAnalyzer(base_url=base_url)
+    print(f"Analyzer Mode: {'Mock' if analyzer.mock_mode else 'Live AI'}" + (f" @ {base_url}" if base_url else ""))
     
     # Create dummy data
     texts = [
@@ -26,7 +28,7 @@ def test_parallel():
     
     print(f"Testing parallel processing with {len(load)} items...")
     start = time.time()
-    results = analyzer.analyze_batch_concurrent(load, max_workers=5)
+    results = list(analyzer.analyze_batch_with_progress(load, max_workers=5))
     end = time.time()
     
     print(f"Time taken: {end - start:.2f}s")
@@ -36,4 +38,21 @@ def test_parallel():
         print(f"[{i}] {res.get('sentiment')} - {res.get('urgency')}")
 
 if __name__ == "__main__":
-    test_parallel()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stub", action="store_true", help="Run against a local stub server (pipeline/stub_llm.py)")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.stub:
+        config = StubConfig(
+            latency_ms=args.latency_ms, error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate, malformed_rate=args.malformed_rate,
+        )
+        with StubLLMServer(config=config) as server:
+            test_parallel(server.url)
+            print(f"Stub stats: {server.stats}")
+    else:
+        test_parallel()
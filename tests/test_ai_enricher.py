@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from pipeline.ai_enricher import ReviewAnalyzer, ROUTER_THRESHOLD
+from pipeline.result_store import EnrichmentStore
+from pipeline.stub_llm import StubLLMServer, StubConfig
+
+
+class FailingStore(EnrichmentStore):
+    """Result store whose put fails for one review text."""
+
+    def __init__(self, path, failing_text):
+        super().__init__(path)
+        self.failing_text = failing_text
+
+    def put(self, key, result, version="", text=None, score=None):
+        if text == self.failing_text:
+            raise sqlite3.OperationalError("database is locked")
+        super().put(key, result, version, text=text, score=score)
+
+
+def _consume(batch, timeout=60):
+    """Drains `batch` on a thread; returns (results, exception) or fails on a hang."""
+    outcome = {"results": [], "error": None}
+
+    def run():
+        try:
+            for pair in batch:
+                outcome["results"].append(pair)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise AssertionError(f"batch hung after {len(outcome['results'])} results")
+    return outcome["results"], outcome["error"]
+
+
+class AsyncEngineFailureTest(unittest.TestCase):
+    def test_store_failure_propagates_instead_of_hanging(self):
+        reviews = [{"text": f"avaliação número {i}, produto chegou bem", "score": 4} for i in range(300)]
+        failing = reviews[150]["text"]
+        with StubLLMServer(config=StubConfig(latency_ms=5, latency_sigma=0, per_item_ms=0, seed=1)) as server:
+            store = FailingStore(os.path.join(tempfile.mkdtemp(), "store.sqlite"), failing)
+            analyzer = ReviewAnalyzer(store=store, base_url=server.url)
+            results, error = _consume(analyzer.analyze_batch_async_as_completed(reviews, max_in_flight=8))
+
+        self.assertIsInstance(error, sqlite3.OperationalError)
+        self.assertLess(len(results), len(reviews))
+
+
+class FallbackRateTest(unittest.TestCase):
+    def test_dedup_members_count_on_both_sides(self):
+        analyzer = ReviewAnalyzer(base_url="http://127.0.0.1:9")
+        # One cluster of 10 answered by the LLM, one cluster of 10 that failed
+        analyzer._with_provenance({}, "llm")
+        for _ in range(9):
+            analyzer._with_provenance({}, "dedup")
+        for _ in range(10):
+            analyzer._with_provenance({}, "rules", error="retryable")
+        analyzer._with_provenance({}, "router")  # Never meant for the LLM
+
+        self.assertAlmostEqual(analyzer.fallback_rate(), 0.5)
+
+
+class RouterTest(unittest.TestCase):
+    # (text, score, confidence): 0.4 * lexicon + 0.35 * score agreement + 0.25 * brevity, x0.6 on "mas"/"porém"
+    CASES = [
+        ("Ótimo", 5, 1.0),                          # Unambiguous praise, agreeing score, short
+        ("Produto chegou atrasado", 5, 0.725),      # No lexicon hit, praise score
+        ("Chegou hoje", None, 0.585),               # No hit, no score
+        ("Produto chegou atrasado", 1, 0.55),       # No hit, complaint score (needs a category)
+        ("Bom, mas atrasou", 2, 0.282),             # Mixed lexicons and an adversative turn
+    ]
+
+    def setUp(self):
+        self.analyzer = ReviewAnalyzer(base_url="http://127.0.0.1:9")
+
+    def test_rule_confidence_values(self):
+        for text, score, expected in self.CASES:
+            self.assertAlmostEqual(self.analyzer.rule_confidence(text, score), expected, places=9, msg=text)
+
+    def test_long_text_loses_the_brevity_term(self):
+        self.assertAlmostEqual(self.analyzer.rule_confidence("a" * 200 + " ótimo", 5), 0.75)
+
+    def test_threshold_boundaries(self):
+        for text, score, confidence in self.CASES:
+            item = [{"text": text, "score": score}]
+            for threshold, routed in ((confidence - 1e-6, True), (confidence, True), (confidence + 1e-6, False)):
+                skipped, pending = self.analyzer.route(item, threshold)
+                self.assertEqual(bool(skipped), routed, (text, threshold))
+                self.assertEqual(pending, [] if routed else [0])
+                if routed:
+                    self.assertEqual(skipped[0]["provenance"]["source"], "router")
+
+    def test_blank_items_never_reach_the_llm(self):
+        skipped, pending = self.analyzer.route([{"text": "", "score": 3}, {"text": None, "score": None}], threshold=1.1)
+        self.assertEqual(pending, [])
+        self.assertEqual({r["provenance"]["source"] for r in skipped.values()}, {"rules"})
+
+    def test_only_low_confidence_items_are_sent(self):
+        reviews = [{"text": text, "score": score} for text, score, _ in self.CASES] * 4
+        low = sum(1 for _, _, confidence in self.CASES if confidence < ROUTER_THRESHOLD) * 4
+        with StubLLMServer(config=StubConfig(latency_ms=5, latency_sigma=0, seed=1)) as server:
+            store = EnrichmentStore(os.path.join(tempfile.mkdtemp(), "store.sqlite"))
+            analyzer = ReviewAnalyzer(store=store, base_url=server.url)
+            results = list(analyzer.analyze_batch_async(reviews, threshold=ROUTER_THRESHOLD))
+            requests = server.stats["requests"]
+
+        sources = [r["provenance"]["source"] for r in results]
+        self.assertEqual(sources.count("router"), len(reviews) - low)
+        self.assertEqual(requests, low)
+        self.assertEqual(analyzer.routing["skipped"], len(reviews) - low)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import io
+import tempfile
+import unittest
+
+from pipeline.data_processor import DataIngestor
+
+
+def _upload(name, text):
+    buffer = io.BytesIO(text.encode("utf-8"))
+    buffer.name = name
+    return buffer
+
+
+class HeaderlessUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.ingestor = DataIngestor(data_dir=tempfile.mkdtemp(), use_snapshots=False)
+
+    def test_schema_names_assigned_when_column_count_matches(self):
+        rows = "".join(f"o{i},1,credit_card,{i % 6 + 1},{10 + i}.50\n" for i in range(20))
+        df = self.ingestor._load_upload("payments", _upload("payments.csv", rows))
+
+        self.assertEqual(list(df.columns), ["order_id", "payment_sequential", "payment_type",
+                                            "payment_installments", "payment_value"])
+        self.assertEqual(len(df), 20)
+        report = self.ingestor.ingest_reports["payments"]
+        self.assertFalse(report.has_header)
+        self.assertIn("assigned", report.message)
+
+    def test_rejected_with_report_when_column_count_differs(self):
+        rows = "".join(f"o{i},1,credit_card,{10 + i}.50\n" for i in range(20))
+        with self.assertRaisesRegex(ValueError, "no header row"):
+            self.ingestor._load_upload("payments", _upload("payments.csv", rows))
+        self.assertIn("header row", self.ingestor.ingest_reports["payments"].message)
+
+    def test_rejection_recorded_in_load_errors(self):
+        rows = "".join(f"o{i},1,credit_card,{10 + i}.50\n" for i in range(20))
+        data = self.ingestor.load_data({"payments": _upload("payments.csv", rows)})
+
+        self.assertIsNone(data)  # No local data to fall back to
+        self.assertIsInstance(self.ingestor.load_errors["payments"], ValueError)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import unittest
+
+import pandas as pd
+
+from pipeline.ai_enricher import ReviewAnalyzer
+from pipeline.dedup import near_duplicate_groups, simhash, dedup_key
+
+REVIEWS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "olist_order_reviews_dataset.csv")
+
+
+def _distance(a, b):
+    return bin(simhash(dedup_key(a).split()) ^ simhash(dedup_key(b).split())).count("1")
+
+
+class NearDuplicateGroupsTest(unittest.TestCase):
+    def test_every_member_within_distance_of_its_representative(self):
+        texts = pd.read_csv(REVIEWS_PATH, usecols=["review_comment_message"], nrows=20000).dropna()["review_comment_message"].tolist()
+        reps = near_duplicate_groups(texts, max_distance=3)
+        for i, rep in enumerate(reps):
+            self.assertLessEqual(rep, i)  # First occurrence leads
+            if dedup_key(texts[i]) != dedup_key(texts[rep]):
+                self.assertLessEqual(_distance(texts[i], texts[rep]), 3, (texts[i], texts[rep]))
+
+    def test_exact_keys_merge_and_short_texts_need_them(self):
+        texts = ["Produto ótimo!", "produto OTIMO", "não recomendo", "recomendo"]
+        self.assertEqual(near_duplicate_groups(texts, max_distance=64), [0, 0, 2, 3])
+
+
+class FakeLocalModel:
+    def predict(self, texts, scores):
+        return [{"sentiment": "Positivo", "category": "Outro", "urgency": "Baixa", "suggested_action": "Fidelizar"} for _ in texts]
+
+
+class LocalBackendTest(unittest.TestCase):
+    def test_local_backend_skips_dedup(self):
+        analyzer = ReviewAnalyzer(base_url="http://127.0.0.1:9")
+        analyzer.local_model = FakeLocalModel()
+        reviews = [{"text": "produto chegou antes do prazo, muito bom", "score": 5}] * 5
+        results = list(analyzer.analyze_batch_async(reviews, dedup=3))
+
+        self.assertIsNone(analyzer.dedup)
+        self.assertEqual({r["provenance"]["source"] for r in results}, {"local"})
+
+
+if __name__ == "__main__":
+    unittest.main()
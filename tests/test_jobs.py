@@ -0,0 +1,62 @@
+import time
+import threading
+import unittest
+
+from pipeline.jobs import JobManager, RUNNING, DONE, CANCELLED
+
+
+class GatedAnalyzer:
+    """Stands in for ReviewAnalyzer: each batch waits for `gate` before answering."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.api_calls = 0
+
+    def analyze_batch_async_as_completed(self, items, **options):
+        self.gate.wait(10)
+        for i, _ in enumerate(items):
+            yield i, {"sentiment": "Positivo", "provenance": {"source": "llm", "error": None}}
+
+    def cancel(self):
+        self.gate.set()
+
+
+def _wait_for(predicate, timeout=5):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class JobManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = GatedAnalyzer()
+        self.jobs = JobManager(lambda: self.analyzer)
+        self.items = [{"text": "chegou bem", "score": 5}] * 3
+
+    def tearDown(self):
+        self.analyzer.gate.set()
+
+    def test_queue_position_counts_running_and_earlier_jobs(self):
+        first = self.jobs.submit(self.items)
+        self.assertTrue(_wait_for(lambda: self.jobs.poll(first)["status"] == RUNNING))
+        second = self.jobs.submit(self.items)
+        third = self.jobs.submit(self.items)
+
+        self.assertEqual(self.jobs.poll(first)["ahead"], 0)
+        self.assertEqual(self.jobs.poll(second)["ahead"], 1)
+        self.assertEqual(self.jobs.poll(third)["ahead"], 2)
+
+        self.jobs.cancel(second)  # Cancelled while queued: no longer ahead of anyone
+        self.assertEqual(self.jobs.poll(third)["ahead"], 1)
+
+        self.analyzer.gate.set()
+        self.assertTrue(_wait_for(lambda: self.jobs.poll(third)["status"] == DONE))
+        self.assertEqual(self.jobs.poll(second)["status"], CANCELLED)
+        self.assertEqual(self.jobs.poll(third)["ahead"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
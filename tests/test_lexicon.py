@@ -0,0 +1,131 @@
+import os
+import unicodedata
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pipeline.ai_enricher import ReviewAnalyzer
+from pipeline.lexicon import RULE_LEXICONS, SANITY_LEXICONS, fold_text, fold_series
+
+REVIEWS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "olist_order_reviews_dataset.csv")
+
+# Accents, case variants and decomposed (NFD) forms the matchers must fold like the old scans
+EDGE_TEXTS = [
+    "NÃO RECOMENDO", "Nao Indico a ninguém", "Não Chegou até hoje", "PÉSSIMO produto",
+    "Ótimo, PARABÉNS", "ótimo", "OTIMO", "Amei!!!", "Vou entrar na Justiça", "JUSTIÇA",
+    unicodedata.normalize("NFD", "não recomendo, péssimo"), unicodedata.normalize("NFD", "Ótimo e perfeito"),
+    "Bom, mas atrasou", "Produto bom porém quebrado", "estou triste e decepcionado", "Não recebi",
+    "nao recebi", "show de bola", "horrível", "HORRÍVEL", "atendimento do sac", "recomendo", "Não recomendo",
+    "ok", "", "x",
+]
+
+
+# --- Reference: the substring scans the compiled matcher replaced ---
+
+_OLD_RULES = [
+    ("not_recommended", ["nao recomendo", "nao indico"]),
+    ("urgency_high", ["processo", "procon", "justiça", "advogado", "nunca mais", "lixo", "golpe", "roubo"]),
+    ("logistics", ["atraso", "demorou", "nao chegou", "extraviado", "sumiu", "correios", "entrega"]),
+    ("general_bad", ["ruim", "pessimo", "terrivel", "odiei", "triste", "insatisfeito"]),
+    ("positive", ["bom", "otimo", "excelente", "amei", "gostei", "recomendo", "top", "show", "perfeito"]),
+]
+_OLD_ALTA = ["atraso", "não recebi", "extraviado", "quebrado", "defeito", "procon", "justiça",
+             "triste", "decepcionado", "chateado", "nunca mais", "indignado", "vergonha", "absurdo", "lixo"]
+_OLD_POSITIVE = ["parabéns", "excelente", "perfeito", "amei", "recomendo", "ótimo", "maravilhoso"]
+
+
+def old_rule_based_analysis(text):
+    normalized = "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+    for name, words in _OLD_RULES:
+        if any(w in normalized for w in words):
+            row = next(r for r in ReviewAnalyzer.RULE_TABLE if r[0] == name)
+            return dict(zip(("sentiment", "category", "urgency", "suggested_action"), row[1:]))
+    return dict(zip(("sentiment", "category", "urgency", "suggested_action"), ReviewAnalyzer.RULE_DEFAULT))
+
+
+def old_sanity_checks(result, score, text_raw):
+    if not score:
+        return result
+    try:
+        score_int = int(float(score))
+        if result.get("sentiment") == "Neutro":
+            if score_int <= 3:
+                result["sentiment"], result["category"] = "Negativo", "Qualidade"
+            elif score_int >= 4:
+                result["sentiment"] = "Positivo"
+        if score_int <= 2 and result.get("sentiment") != "Negativo":
+            result["sentiment"] = "Negativo"
+        elif score_int == 5 and result.get("sentiment") != "Positivo":
+            result["sentiment"] = "Positivo"
+        if result.get("sentiment") == "Negativo":
+            if result.get("urgency") == "Baixa":
+                result["urgency"] = "Média"
+            if any(t in text_raw.lower() for t in _OLD_ALTA):
+                result["urgency"] = "Alta"
+                if "triste" in text_raw.lower() or "decepcionado" in text_raw.lower():
+                    result["suggested_action"] = "Acolhimento + Solução"
+                else:
+                    result["suggested_action"] = "Resolução Imediata / Estorno"
+        if any(t in text_raw.lower() for t in _OLD_POSITIVE) and score_int >= 4:
+            result["sentiment"] = "Positivo"
+            result["category"] = "Outro" if result.get("category") == "Unknown" else result.get("category")
+            result["suggested_action"] = "Agradecer e Fidelizar"
+    except Exception:
+        pass
+    return result
+
+
+def old_analyze_offline(text, score):
+    if not text or text != text or len(str(text)) < 2:
+        return {"sentiment": "Neutral", "category": "Unknown", "urgency": "Baixa", "suggested_action": "None"}
+    return old_sanity_checks(old_rule_based_analysis(text), score, text)
+
+
+def _labels(result):
+    return {k: result[k] for k in ("sentiment", "category", "urgency", "suggested_action")}
+
+
+class LexiconParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        sample = pd.read_csv(REVIEWS_PATH, usecols=["review_score", "review_comment_message"], nrows=5000)
+        texts = sample["review_comment_message"].tolist() + EDGE_TEXTS * 3
+        scores = sample["review_score"].tolist() + [1] * len(EDGE_TEXTS) + [3] * len(EDGE_TEXTS) + [5] * len(EDGE_TEXTS)
+        cls.frame = pd.DataFrame({"text": texts + [np.nan, None], "score": scores + [4, np.nan]})
+        cls.texts = [t for t in cls.frame["text"] if isinstance(t, str)]
+
+        cls.analyzer = ReviewAnalyzer(base_url="http://127.0.0.1:9")  # No default store
+        cls.analyzer.mock_mode = True  # Offline: rules + sanity matrix only
+
+    def test_matchers_equal_substring_scans(self):
+        for text in self.texts:
+            folded = fold_text(text)
+            expected = {name for name, words in RULE_LEXICONS.lexicons.items() if any(w in folded for w in words)}
+            self.assertEqual(RULE_LEXICONS.categories(folded), expected, text)
+            lowered = text.lower()
+            expected = {name for name, words in SANITY_LEXICONS.lexicons.items() if any(w in lowered for w in words)}
+            self.assertEqual(SANITY_LEXICONS.categories(lowered), expected, text)
+
+    def test_fold_series_equals_fold_text(self):
+        series = pd.Series(self.texts)
+        self.assertEqual(fold_series(series).tolist(), [fold_text(t) for t in self.texts])
+
+    def test_rule_engine_matches_old_scans(self):
+        for text in self.texts:
+            self.assertEqual(self.analyzer._rule_based_analysis(text), old_rule_based_analysis(text), text)
+
+    def test_per_row_path_matches_old_path(self):
+        for text, score in zip(self.frame["text"], self.frame["score"]):
+            result = self.analyzer.analyze_review(text, score=score)
+            self.assertEqual(_labels(result), _labels(old_analyze_offline(text, score)), (text, score))
+
+    def test_classify_series_matches_per_row(self):
+        labels = self.analyzer.classify_series(self.frame["text"], self.frame["score"])
+        for row, (text, score) in zip(labels.itertuples(index=False), zip(self.frame["text"], self.frame["score"])):
+            expected = _labels(self.analyzer.analyze_review(text, score=score))
+            self.assertEqual(row._asdict(), expected, (text, score))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import time
+import asyncio
+import unittest
+
+from pipeline.rate_limit import AimdController, RateLimiter, TokenBucket
+
+
+class AimdControllerTest(unittest.TestCase):
+    def test_burst_of_throttles_halves_once(self):
+        aimd = AimdController(initial=64)
+        sent_at = time.monotonic()  # Six requests in flight at the old rate
+        for _ in range(6):
+            aimd.on_throttle(sent_at)
+        self.assertEqual(aimd.limit, 32)
+
+    def test_throttle_after_the_decrease_halves_again(self):
+        aimd = AimdController(initial=64)
+        aimd.on_throttle(time.monotonic())
+        self.assertTrue(aimd.on_throttle(time.monotonic()))
+        self.assertEqual(aimd.limit, 16)
+
+    def test_additive_increase_after_first_throttle(self):
+        aimd = AimdController(initial=16)
+        aimd.on_throttle()
+        for _ in range(9):  # About one window of successes (the step is 1/limit)
+            aimd.on_success()
+        self.assertEqual(aimd.limit, 9)
+
+    def test_never_below_minimum(self):
+        aimd = AimdController(initial=2)
+        for _ in range(5):
+            aimd.on_throttle()
+        self.assertEqual(aimd.limit, 1)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_first_calibration_trusts_remaining(self):
+        bucket = TokenBucket()
+        bucket.calibrate(limit=6000, remaining=5000)
+        self.assertEqual(bucket.capacity, 6000)
+        self.assertAlmostEqual(bucket.level, 5000, delta=1)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_throttle_ignores_daily_request_reset(self):
+        limiter = RateLimiter()
+        wait = limiter.on_throttle({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2h13m"})
+        self.assertEqual(wait, 1.0)
+
+    def test_throttle_waits_for_token_reset_when_tokens_are_spent(self):
+        limiter = RateLimiter()
+        wait = limiter.on_throttle({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "7.5s"})
+        self.assertEqual(wait, 7.5)
+
+    def test_parked_acquire_is_woken_by_release(self):
+        async def scenario():
+            limiter = RateLimiter(initial_concurrency=1)
+            await limiter.acquire_async(0)
+            second = asyncio.create_task(limiter.acquire_async(0))
+            await asyncio.sleep(0.05)
+            parked = not second.done()
+            limiter.release()
+            await asyncio.wait_for(second, timeout=1)
+            return parked, limiter._in_flight
+
+        parked, in_flight = asyncio.run(scenario())
+        self.assertTrue(parked)
+        self.assertEqual(in_flight, 1)
+
+    def test_cancelled_waiter_gives_its_slot_back(self):
+        async def scenario():
+            limiter = RateLimiter(initial_concurrency=1)
+            await limiter.acquire_async(0)
+            waiting = asyncio.create_task(limiter.acquire_async(0))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            limiter.release()
+            await asyncio.sleep(0.01)
+            await asyncio.wait_for(limiter.acquire_async(0), timeout=1)
+            return limiter._in_flight
+
+        self.assertEqual(asyncio.run(scenario()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
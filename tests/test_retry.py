@@ -0,0 +1,81 @@
+import unittest
+from types import SimpleNamespace
+
+import groq
+import httpx
+
+from pipeline.ai_enricher import ReviewAnalyzer
+from pipeline.retry import (
+    RetryPolicy, classify_error, DeadlineExceeded, Cancelled, ResponseParseError,
+    RETRYABLE, RATE_LIMITED, PARSE, DEADLINE, CANCELLED, FATAL,
+)
+
+
+def _status_error(cls, status):
+    request = httpx.Request("POST", "http://127.0.0.1/openai/v1/chat/completions")
+    return cls("error", response=httpx.Response(status, request=request), body=None)
+
+
+def _completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class ClassifyErrorTest(unittest.TestCase):
+    def test_provider_errors(self):
+        self.assertEqual(classify_error(_status_error(groq.RateLimitError, 429)), RATE_LIMITED)
+        self.assertEqual(classify_error(_status_error(groq.InternalServerError, 503)), RETRYABLE)
+        self.assertEqual(classify_error(_status_error(groq.APIStatusError, 408)), RETRYABLE)
+        self.assertEqual(classify_error(_status_error(groq.AuthenticationError, 401)), FATAL)
+        self.assertEqual(classify_error(_status_error(groq.BadRequestError, 400)), FATAL)
+        request = httpx.Request("POST", "http://127.0.0.1")
+        self.assertEqual(classify_error(groq.APITimeoutError(request=request)), RETRYABLE)
+
+    def test_only_parse_failures_are_parse(self):
+        self.assertEqual(classify_error(ResponseParseError("not json")), PARSE)
+        # Bugs outside the parse step must not turn into retries and a silent fallback
+        for bug in (ValueError("x"), KeyError("x"), TypeError("x"), AttributeError("x")):
+            self.assertEqual(classify_error(bug), FATAL)
+
+    def test_deadline_and_cancel_have_their_own_kind(self):
+        self.assertEqual(classify_error(DeadlineExceeded()), DEADLINE)
+        self.assertEqual(classify_error(Cancelled()), CANCELLED)
+        self.assertFalse(RetryPolicy().should_retry(DEADLINE, 0))
+        self.assertFalse(RetryPolicy().should_retry(CANCELLED, 0))
+
+    def test_malformed_answers_raise_response_parse_error(self):
+        parse = ReviewAnalyzer._parse_response
+        self.assertEqual(ReviewAnalyzer._parse_completion(parse, _completion('{"sentiment": "Positivo"}')), {"sentiment": "Positivo"})
+        for content in ("Desculpe, não consegui.", None):
+            with self.assertRaises(ResponseParseError):
+                ReviewAnalyzer._parse_completion(parse, _completion(content))
+        with self.assertRaises(ResponseParseError):
+            ReviewAnalyzer._parse_completion(parse, SimpleNamespace(choices=[]))
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(max_retries=3, parse_retries=1, base=0.5, cap=4.0)
+
+    def test_retry_budget_per_kind(self):
+        self.assertTrue(self.policy.should_retry(RETRYABLE, 2))
+        self.assertFalse(self.policy.should_retry(RETRYABLE, 3))
+        self.assertTrue(self.policy.should_retry(RATE_LIMITED, 2))
+        self.assertFalse(self.policy.should_retry(RATE_LIMITED, 3))
+        self.assertTrue(self.policy.should_retry(PARSE, 0))
+        self.assertFalse(self.policy.should_retry(PARSE, 1))
+        self.assertFalse(self.policy.should_retry(FATAL, 0))
+
+    def test_backoff_is_capped_full_jitter(self):
+        for attempt in range(10):
+            delay = self.policy.backoff(RETRYABLE, attempt)
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, min(4.0, 0.5 * 2 ** attempt))
+
+    def test_rate_limited_backoff_is_only_jitter(self):
+        # The limiter already waits for retry-after
+        for attempt in range(10):
+            self.assertLessEqual(self.policy.backoff(RATE_LIMITED, attempt), 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from pipeline.ai_enricher import ReviewAnalyzer
+from pipeline.rate_limit import RateLimiter
+from pipeline.result_store import EnrichmentStore
+from pipeline.stub_llm import StubLLMServer, StubConfig
+
+
+class StubServerTest(unittest.TestCase):
+    def test_burst_without_errors_makes_one_call_per_item(self):
+        # 1000 requests at once: the listen backlog must absorb the burst, or
+        # refused connections show up as retried calls
+        reviews = [{"text": f"avaliação número {i}, produto chegou bem", "score": 5} for i in range(1000)]
+        with StubLLMServer(config=StubConfig(latency_ms=50, latency_sigma=0, seed=1)) as server:
+            store = EnrichmentStore(os.path.join(tempfile.mkdtemp(), "store.sqlite"))
+            analyzer = ReviewAnalyzer(store=store, base_url=server.url)
+            analyzer.limiter = RateLimiter(initial_concurrency=1000, max_concurrency=1000)  # No AIMD ramp: all in flight
+            results = list(analyzer.analyze_batch_async(reviews, max_in_flight=1000))
+
+            self.assertEqual(len(results), 1000)
+            self.assertEqual(analyzer.api_calls, 1000)
+            self.assertEqual(server.stats["requests"], 1000)
+            self.assertEqual(analyzer.fallback_rate(), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()